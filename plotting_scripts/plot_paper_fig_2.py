@@ -4,6 +4,13 @@ This script loads the true solution and the computed solutions from checkpoint f
 computes the errors, and generates convergence plots for the errors.
 The test case is the gravity wave test case.
 The script also plots the gravity wave solution at a specific time.
+
+With --richardson, the reference solution is not a separate fine-grid "true"
+run, but is built by Richardson extrapolation from the finest plotted run and
+the extra refinement level made by `gw_convergence_oN.py --richardson`, after
+interpolating them onto the function space of the extra level. The extra
+level is required: extrapolating from the plotted runs alone would make the
+error of the finest of them converge at the assumed order by construction.
 """
 
 import matplotlib.pyplot as plt
@@ -12,6 +19,7 @@ from firedrake import *
 import numpy as np
 from netCDF4 import Dataset
 import os
+import sys
 import pandas as pd
 from tomplot import (set_tomplot_style, plot_convergence,
                      only_minmax_ticklabels, tomplot_legend_ax,
@@ -55,6 +63,37 @@ def compute_errors(field_name, dxs, dts, file_path, file_name, true_data):
             print(f"Error: {error}")
 
     return errors
+
+def load_solution(field_name, file_path, dx, dt, file_name):
+    data_path = os.path.join(file_path+dx+ "_dt_"+dt, file_name)
+    print(f"Loading data from: {data_path}")
+    with CheckpointFile(data_path, 'r') as afile:
+        mesh = afile.load_mesh("firedrake_default_extruded")
+        field = afile.load_function(mesh, field_name)
+    return field
+
+def richardson_reference(field_name, dxs, dts, file_path, file_name, order):
+    """
+    Richardson extrapolation from the two finest runs (the last two of dxs
+    and dts, refined by a factor of 2 in both dx and dt), assuming an error
+    of order `order`. The finest run must not be one of those plotted. The coarser run is interpolated onto the function
+    space of the finer one, which is the common evaluation grid. The order
+    observed from the three finest runs is printed as a check.
+    """
+    fields = [load_solution(field_name, file_path, dx, dt, file_name)
+              for dx, dt in zip(dxs[-3:], dts[-3:])]
+    field_fine = fields[-1]
+    V = field_fine.function_space()
+    on_grid = [Function(V).interpolate(field) for field in fields[:-1]] + [field_fine]
+
+    if len(on_grid) == 3:
+        observed = np.log2(errornorm(on_grid[0], on_grid[1])
+                           / errornorm(on_grid[1], on_grid[2]))
+        print(f"Observed order: {observed}, extrapolating with order {order}")
+
+    field_ref = Function(V)
+    field_ref.assign(field_fine + (field_fine - on_grid[-2])/(2**order - 1))
+    return field_ref, field_ref.function_space().mesh()
 # ---------------------------------------------------------------------------- #
 # Some dummy data
 # ---------------------------------------------------------------------------- #
@@ -64,6 +103,9 @@ orders = [1, 3, 5]
 
 field_name= "theta"
 
+# Build the reference by Richardson extrapolation, rather than loading it
+richardson = '--richardson' in sys.argv
+
 # ---------------------------------------------------------------------------- #
 # Directory for results and plots
 # ---------------------------------------------------------------------------- #
@@ -106,7 +148,17 @@ for order in orders:
         dx_real_values = [  10000.,  5000., 2500.]
         dt_values=       [   "1.875", "0.9375", "0.46875"]
 
-    true_sol = load_true_solution(field_name, true_field_path, dx_true, dt_true, "chkpt.h5")
+    if richardson:
+        # The extra level of refinement, beyond the plotted runs
+        dx_extra = str(float(dx_values[-1])/2)
+        dt_extra = str(float(dt_values[-1])/2)
+        if not os.path.exists(os.path.join(field_path+dx_extra+"_dt_"+dt_extra, "chkpt.h5")):
+            sys.exit(f"No extra refinement level for order {order}, run "
+                     f"gw_convergence_o{order}.py --richardson first")
+        dxs_ref, dts_ref = dx_values + [dx_extra], dt_values + [dt_extra]
+        true_sol = richardson_reference(field_name, dxs_ref, dts_ref, field_path, "chkpt.h5", order+1)
+    else:
+        true_sol = load_true_solution(field_name, true_field_path, dx_true, dt_true, "chkpt.h5")
     data= compute_errors(field_name, dx_values, dt_values, field_path, "chkpt.h5", true_sol)
     all_error_data.append(data)
     dx_data.append(dx_real_values)
@@ -0,0 +1,45 @@
+"""
+Tune the Newton-Krylov options of the IMEX-SDC node solves for each case, by
+timing shortened runs over a search space of options, and write the best
+options found for each case to a file. The other scripts use them when
+given that file with --solver-options.
+
+For example
+
+    mpiexec -n N python autotune_solvers.py gravity_wave --output solver_options.json
+
+N should be the number of processes that the case is normally run on.
+"""
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from petsc4py import PETSc
+PETSc.Sys.popErrorHandler()
+from sdc_cases.autotune import reduced_settings, tune_case, write_solver_options
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description=__doc__,
+        formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        'cases',
+        help="The cases to tune. Defaults to all that use the Newton solver.",
+        nargs='*',
+        default=sorted(reduced_settings)
+    )
+    parser.add_argument(
+        '--output',
+        help="The file to write the tuned options to.",
+        type=str,
+        default='solver_options.json'
+    )
+    args = parser.parse_args()
+
+    for name in args.cases:
+        result = tune_case(name)
+        PETSc.Sys.Print(f"{name}: best options {result['options']} took "
+                        + f"{result['time']:.2f}s, against "
+                        + f"{result['baseline']['time']:.2f}s with the defaults")
+        write_solver_options({name: result}, args.output)
@@ -0,0 +1,61 @@
+"""
+Benchmark layouts of the netCDF field output of a run: one chunk per time
+index of each field, with zlib compression at several levels, with and
+without the shuffle filter. For each layout, the time to write the file, its
+size and the time to read the last time index of every field (as the
+plotting scripts do) are printed, alongside those of the file as gusto wrote
+it, e.g.
+
+    python benchmark_nc_layout.py results/dry_baroclinic_channel_imex_sdc/field_output.nc
+
+Read times are the best of several repeats, so they are of a file in the
+page cache; run the plotting scripts to compare cold reads on shared storage.
+The fastest layout can be given to a run with the `nc_layout` setting.
+"""
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+import json
+
+from sdc_cases.nc_layout import benchmark_layouts, format_result
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description=__doc__,
+        formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        'filename',
+        help="The netCDF field output to benchmark."
+    )
+    parser.add_argument(
+        '--complevels',
+        help="The zlib levels to compare, with 0 for chunking only.",
+        nargs='+',
+        type=int,
+        default=[0, 1, 4, 9]
+    )
+    parser.add_argument(
+        '--repeats',
+        help="The number of reads of each file to take the best of.",
+        type=int,
+        default=3
+    )
+    parser.add_argument(
+        '--output',
+        help="The file to write the results to.",
+        type=str,
+        default='nc_layout_benchmark.json'
+    )
+    args = parser.parse_args()
+
+    layouts = [{'complevel': 0, 'shuffle': False}] if 0 in args.complevels else []
+    layouts += [{'complevel': level, 'shuffle': shuffle}
+                for level in args.complevels if level > 0
+                for shuffle in [False, True]]
+
+    results = benchmark_layouts(args.filename, layouts, args.repeats)
+    for result in results:
+        print(format_result(result))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
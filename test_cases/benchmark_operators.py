@@ -0,0 +1,60 @@
+"""
+Benchmark the representations of the Jacobian of the IMEX-SDC node solves
+(matrix-free with an assembled preconditioner, assembled aij or baij, and
+fully matrix-free) for the gravity wave at orders 1 and 5 and the baroclinic
+channel, at several mesh sizes. The setup time, time per Krylov iteration,
+total solve time and peak memory of each run are printed and written to a
+file.
+
+For example
+
+    mpiexec -n N python benchmark_operators.py gravity_wave_o1 --output operator_benchmark.json
+"""
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from petsc4py import PETSc
+PETSc.Sys.popErrorHandler()
+from sdc_cases.common import operators
+from sdc_cases.operator_benchmark import (
+    benchmark_cases, benchmark_case, format_result, write_results
+)
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description=__doc__,
+        formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        'cases',
+        help="The benchmarks to run. Defaults to all of them.",
+        nargs='*'
+    )
+    parser.add_argument(
+        '--operators',
+        help="The operators to compare.",
+        nargs='+',
+        choices=operators,
+        default=operators
+    )
+    parser.add_argument(
+        '--output',
+        help="The file to write the results to.",
+        type=str,
+        default='operator_benchmark.json'
+    )
+    args = parser.parse_args()
+
+    unknown = set(args.cases) - set(benchmark_cases)
+    if unknown:
+        parser.error(f"unknown benchmarks {sorted(unknown)}, options are "
+                     f"{sorted(benchmark_cases)}")
+    cases = args.cases or sorted(benchmark_cases)
+
+    results = []
+    for label in cases:
+        for result in benchmark_case(label, args.operators):
+            PETSc.Sys.Print(format_result(result))
+            results.append(result)
+        write_results(results, args.output)
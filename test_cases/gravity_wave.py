@@ -11,30 +11,12 @@ from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 from petsc4py import PETSc
 PETSc.Sys.popErrorHandler()
-import itertools
-from firedrake import (
-    as_vector, SpatialCoordinate, PeriodicIntervalMesh, ExtrudedMesh, exp, sin,
-    Function, pi, COMM_WORLD
-)
-import numpy as np
-from gusto import (
-    Domain, IO, OutputParameters, SemiImplicitQuasiNewton, SSPRK3, DGUpwind,
-    SUPGOptions, CourantNumber, Perturbation, Gradient,
-    CompressibleParameters, CompressibleEulerEquations, CompressibleSolver,
-    compressible_hydrostatic_balance, logger, RichardsonNumber,
-    RungeKuttaFormulation, Timestepper, IMEX_SSP3, split_continuity_form,
-    implicit, explicit, time_derivative, transport, TrapeziumRule, IMEX_Euler,
-    SDC, split_hv_advective_form, SplitDGUpwind, ThetaLimiter, MixedFSLimiter,
-    horizontal_transport, vertical_transport
-)
+from sdc_cases import run_case, run_with_output_member, load_solver_options
+from sdc_cases.gravity_wave import gravity_wave_defaults
 
 skamarock_klemp_nonhydrostatic_defaults = {
-    'ncolumns': 150,
-    'nlayers': 10,
-    'dt': 12.0,
-    'tmax': 3000.,
-    'dumpfreq': 125,
-    'dirname': 'skamarock_klemp_nonhydrostatic'
+    key: gravity_wave_defaults[key]
+    for key in ['ncolumns', 'nlayers', 'dt', 'tmax', 'dumpfreq', 'dirname']
 }
 
 
@@ -44,164 +26,30 @@ def skamarock_klemp_nonhydrostatic(
         dt=skamarock_klemp_nonhydrostatic_defaults['dt'],
         tmax=skamarock_klemp_nonhydrostatic_defaults['tmax'],
         dumpfreq=skamarock_klemp_nonhydrostatic_defaults['dumpfreq'],
-        dirname=skamarock_klemp_nonhydrostatic_defaults['dirname']
+        dirname=skamarock_klemp_nonhydrostatic_defaults['dirname'],
+        sdc_tolerance=None,
+        inexact_sdc=None,
+        pc_refresh_growth=None,
+        solver_log=False,
+        preconditioner='star',
+        hybridised=False,
+        initial_guess='copy',
+        async_output=False,
+        nc_complevel=None,
+        probe_fields=[]
 ):
 
-    # ------------------------------------------------------------------------ #
-    # Test case parameters
-    # ------------------------------------------------------------------------ #
-
-    domain_width = 3.0e5      # Width of domain (m)
-    domain_height = 1.0e4     # Height of domain (m)
-    Tsurf = 300.              # Temperature at surface (K)
-    wind_initial = 20.        # Initial wind in x direction (m/s)
-    pert_width = 5.0e3        # Width parameter of perturbation (m)
-    deltaTheta = 1.0e-2       # Magnitude of theta perturbation (K)
-    N = 0.01                  # Brunt-Vaisala frequency (1/s)
-
-    # ------------------------------------------------------------------------ #
-    # Our settings for this set up
-    # ------------------------------------------------------------------------ #
-
-    element_order = 1
-    u_eqn_type = 'vector_advection_form'
-
-    # ------------------------------------------------------------------------ #
-    # Set up model objects
-    # ------------------------------------------------------------------------ #
-
-    # Domain -- 3D volume mesh
-    base_mesh = PeriodicIntervalMesh(ncolumns, domain_width)
-    mesh = ExtrudedMesh(base_mesh, nlayers, layer_height=domain_height/nlayers)
-    domain = Domain(mesh, dt, "CG", element_order)
-
-    # Equation
-    parameters = CompressibleParameters(mesh=mesh)
-    eqns = CompressibleEulerEquations(domain, parameters, u_transport_option=u_eqn_type)
-    eqns = split_continuity_form(eqns)
-    eqns = split_hv_advective_form(eqns, "rho")
-    eqns = split_hv_advective_form(eqns, "theta")
-    opts =SUPGOptions(suboptions={"theta": [transport]})
-
-    print("Opt Cores:", eqns.X.function_space().dim()/50000.)
-
-    # I/O
-    points_x = np.linspace(0., domain_width, 100)
-    points_z = [domain_height/2.]
-    points = np.array([p for p in itertools.product(points_x, points_z)])
-
-    # Dumping point data using legacy PointDataOutput is not supported in parallel
-    output = OutputParameters(dirname=dirname,
-                            dumpfreq=dumpfreq,
-                            checkpoint=True,
-                            dump_nc=True,
-                            dump_vtus=False,
-                            checkpoint_method="checkpointfile",
-                            chkptfreq=dumpfreq,
-                            dumplist=['u','theta','rho'])
-
-    diagnostic_fields = [
-        CourantNumber(), Gradient('u'), Perturbation('theta'),
-        Gradient('theta_perturbation'), Perturbation('rho'),
-        RichardsonNumber('theta', parameters.g/Tsurf), Gradient('theta')
-    ]
-    io = IO(domain, output, diagnostic_fields=diagnostic_fields)
-
-    # Transport schemes
-    transport_methods = [DGUpwind(eqns, "u"),
-                        SplitDGUpwind(eqns, "rho"),
-                        SplitDGUpwind(eqns, "theta", ibp=SUPGOptions.ibp)]
-    nl_solver_parameters = {
-    "snes_converged_reason": None,
-    "snes_lag_preconditioner_persists":None,
-    "snes_lag_preconditioner":-2,
-    "snes_lag_jacobian": -2,
-    "snes_lag_jacobian_persists": None,
-    'ksp_ew': None,
-    'ksp_ew_version': 1,
-    "ksp_ew_threshold": 1e-2,
-    "ksp_ew_rtol0": 1e-3,
-    "mat_type": "matfree",
-    "ksp_type": "gmres",
-    "ksp_converged_reason": None,
-    "ksp_atol": 1e-4,
-    "ksp_rtol": 1e-4,
-    "snes_atol": 1e-4,
-    "snes_rtol": 1e-4,
-    "ksp_max_it": 400,
-    "pc_type": "python",
-    "pc_python_type": "firedrake.AssembledPC","assembled": {
-        "pc_type": "python",
-        "pc_python_type": "firedrake.ASMStarPC",
-        "pc_star": {
-            "construct_dim": 0,
-            "sub_sub": {
-                "pc_type": "lu",
-                "pc_factor_mat_ordering_type": "rcm",
-                "pc_factor_reuse_ordering": None,
-                "pc_factor_reuse_fill": None,
-                "pc_factor_fill": 1.2
-            }
-        },
-    },}
-    eqns.label_terms(lambda t: not any(t.has_label(time_derivative, transport)), implicit)
-    eqns.label_terms(lambda t: t.has_label(transport) and t.has_label(horizontal_transport), explicit)
-    eqns.label_terms(lambda t: t.has_label(transport) and t.has_label(vertical_transport), implicit)
-    eqns.label_terms(lambda t: t.has_label(transport) and not any(t.has_label(horizontal_transport, vertical_transport)), explicit)
-    base_scheme = IMEX_Euler(domain, options=opts,nonlinear_solver_parameters=nl_solver_parameters)
-    node_type = "LEGENDRE"
-    qdelta_exp = "FE"
-    quad_type = "GAUSS"
-    M = 2
-    k = 3
-    qdelta_imp = "LU"
-    scheme =SDC(base_scheme, domain, M, k, quad_type, node_type, qdelta_imp,
-                        qdelta_exp, options = opts,formulation="Z2N", nonlinear_solver_parameters=nl_solver_parameters,final_update=True, initial_guess="copy")
-    # Time stepper
-    stepper = Timestepper(eqns, scheme, io, transport_methods)
-
-    # ------------------------------------------------------------------------ #
-    # Initial conditions
-    # ------------------------------------------------------------------------ #
-
-    u0 = stepper.fields("u")
-    rho0 = stepper.fields("rho")
-    theta0 = stepper.fields("theta")
-
-    # spaces
-    Vt = domain.spaces("theta")
-    Vr = domain.spaces("DG")
-
-    # Thermodynamic constants required for setting initial conditions
-    # and reference profiles
-    g = parameters.g
-
-    x, z = SpatialCoordinate(mesh)
-
-    # N^2 = (g/theta)dtheta/dz => dtheta/dz = theta N^2g => theta=theta_0exp(N^2gz)
-    thetab = Tsurf*exp(N**2*z/g)
-
-    theta_b = Function(Vt).interpolate(thetab)
-    rho_b = Function(Vr)
-
-    # Calculate hydrostatic exner
-    compressible_hydrostatic_balance(eqns, theta_b, rho_b)
-
-    theta_pert = (
-        deltaTheta * sin(pi*z/domain_height)
-        / (1 + (x - domain_width/2)**2 / pert_width**2)
-    )
-    theta0.interpolate(theta_b + theta_pert)
-    rho0.assign(rho_b)
-    u0.project(as_vector([wind_initial, 0.0]))
-
-    stepper.set_reference_profiles([('rho', rho_b), ('theta', theta_b)])
-
-    # ------------------------------------------------------------------------ #
-    # Run
-    # ------------------------------------------------------------------------ #
-
-    stepper.run(t=0, tmax=tmax)
+    run = run_with_output_member if async_output else run_case
+    run('gravity_wave', ncolumns=ncolumns, nlayers=nlayers, dt=dt,
+        tmax=tmax, dumpfreq=dumpfreq, dirname=dirname,
+        sdc_tolerance=sdc_tolerance, inexact_sdc=inexact_sdc,
+        pc_refresh_growth=pc_refresh_growth,
+        solver_log=solver_log,
+        preconditioner=preconditioner, hybridised=hybridised,
+        initial_guess=initial_guess,
+        nc_layout=None if nc_complevel is None else {
+            'complevel': nc_complevel, 'shuffle': nc_complevel > 0},
+        probe_fields=probe_fields)
 
 # ---------------------------------------------------------------------------- #
 # MAIN
@@ -250,6 +98,88 @@ if __name__ == "__main__":
         type=str,
         default=skamarock_klemp_nonhydrostatic_defaults['dirname']
     )
+    parser.add_argument(
+        '--sdc-tolerance',
+        help="If given, stop the SDC sweeps of each step once the relative "
+        + "collocation residual is below this, making at most k sweeps.",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--inexact-sdc',
+        help="If given, the Newton solves of each SDC sweep but the last stop "
+        + "at this factor times the relative collocation residual.",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--pc-refresh-growth',
+        help="If given, rebuild the Jacobian and preconditioner of a node "
+        + "solve once its Krylov iterations per Newton iteration grow by this "
+        + "factor from just after they were last built.",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--solver-log',
+        help="Write the wall time and solver iterations of each stage of "
+        + "each step to solver_log.csv in the output directory.",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--preconditioner',
+        help="The preconditioner of the node solves: vertex-star patches, or "
+        + "vertical column patches.",
+        choices=['star', 'column'],
+        default='star'
+    )
+    parser.add_argument(
+        '--hybridised',
+        help="Replace the Newton solve at each node by a single hybridised "
+        + "linear solve about the reference profiles, leaving the SDC sweeps "
+        + "to correct the linearisation error.",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--initial-guess',
+        help="The SDC predictor: copy the start value to every node, take "
+        + "steps of the base scheme, or extrapolate the previous step's "
+        + "collocation polynomial.",
+        choices=['copy', 'base', 'extrapolate'],
+        default='copy'
+    )
+    parser.add_argument(
+        '--async-output',
+        help="Write the field output from a process of its own, while the "
+        + "others step the model.",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--nc-complevel',
+        help="Rewrite the field output at the end of the run with one chunk "
+        + "per time index of each field, compressed with zlib at this level "
+        + "and the shuffle filter, or only chunked if 0.",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--probe-fields',
+        help="Fields to record at every step at 100 points along the middle "
+        + "height of the domain, in probes.nc.",
+        nargs='+',
+        default=[]
+    )
+    parser.add_argument(
+        '--solver-options',
+        help="A file of tuned solver options, written by autotune_solvers.py.",
+        type=str,
+        default=None
+    )
     args, unknown = parser.parse_known_args()
+    args = vars(args)
+
+    solver_options = args.pop('solver_options')
+    if solver_options is not None:
+        load_solver_options(solver_options)
 
-    skamarock_klemp_nonhydrostatic(**vars(args))
+    skamarock_klemp_nonhydrostatic(**args)
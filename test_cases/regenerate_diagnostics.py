@@ -0,0 +1,37 @@
+"""
+Compute diagnostic fields of a finished (or interrupted) run from its latest
+checkpoint, for diagnostics that were not output during the run. The run is
+given as for run_cases.py, with the settings it was made with, followed by
+the names of the diagnostic fields. They are written with the mesh to
+diagnostics.h5 in the run's output directory, e.g.
+
+    mpiexec -n N python regenerate_diagnostics.py gravity_wave:dt=6.0 RichardsonNumber theta_gradient
+"""
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+
+from petsc4py import PETSc
+PETSc.Sys.popErrorHandler()
+from sdc_cases import regenerate_diagnostics
+from run_cases import parse_run
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description=__doc__,
+        formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        'run',
+        help="The run, as name[:key=value,...]."
+    )
+    parser.add_argument(
+        'diagnostics',
+        help="The names of the diagnostic fields to compute.",
+        nargs='+'
+    )
+    args = parser.parse_args()
+
+    name, overrides = parse_run(args.run)
+    t = regenerate_diagnostics(name, args.diagnostics, **overrides)
+    PETSc.Sys.Print(f"Diagnostics at t = {t} written")
@@ -0,0 +1,71 @@
+"""
+Run one or more of the registered test cases in a single process, so that
+the firedrake/gusto imports, meshes and compiled kernels are shared between
+the runs.
+
+Each run is given as the case name, optionally followed by a colon and a
+comma separated list of settings, e.g.
+
+    mpiexec -n 3 python run_cases.py gravity_wave:dt=6.0 gravity_wave:dt=3.0
+"""
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from ast import literal_eval
+
+from petsc4py import PETSc
+PETSc.Sys.popErrorHandler()
+from sdc_cases import CASES, run, ensemble_run, load_solver_options
+
+
+def parse_run(spec):
+    """Turn 'name:key=value,key=value' into a (name, overrides) pair."""
+    name, _, settings = spec.partition(':')
+    overrides = {}
+    for setting in filter(None, settings.split(',')):
+        key, value = setting.split('=', 1)
+        try:
+            overrides[key] = literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[key] = value
+    return name, overrides
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(
+        description=__doc__,
+        formatter_class=RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        'runs',
+        help="The runs to make, as name[:key=value,...].",
+        nargs='*'
+    )
+    parser.add_argument(
+        '--ensemble',
+        help="Run the cases concurrently, splitting the processes between "
+        + "them in proportion to their estimated cost.",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--solver-options',
+        help="A file of tuned solver options, written by autotune_solvers.py.",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--list',
+        help="List the registered cases and their default settings.",
+        action='store_true'
+    )
+    args = parser.parse_args()
+
+    if args.solver_options is not None:
+        load_solver_options(args.solver_options)
+
+    if args.list:
+        for name, (_, defaults) in sorted(CASES.items()):
+            print(name, {k: v for k, v in defaults.items() if k != 'comm'})
+    elif args.ensemble:
+        ensemble_run([parse_run(spec) for spec in args.runs])
+    else:
+        run([parse_run(spec) for spec in args.runs])
@@ -0,0 +1,19 @@
+"""
+Shared library of the test cases used in the paper.
+
+Importing this package registers every case, so that they can be set up and
+run by name, several at a time, from one process:
+
+    from sdc_cases import run
+    run([('gravity_wave', {'dt': 6.0}), ('gravity_wave', {'dt': 3.0})])
+"""
+from .registry import (  # noqa: F401
+    CASES, register_case, case_config, case_cost, setup_case, run_case, run
+)
+from .ensemble import ensemble_run  # noqa: F401
+from .async_output import run_with_output_member  # noqa: F401
+from .scheduler import pool_run, ensemble_pool_run  # noqa: F401
+from .reference_cache import run_reference  # noqa: F401
+from .diagnostics import regenerate_diagnostics  # noqa: F401
+from .common import load_solver_options  # noqa: F401
+from . import gravity_wave, moist_bf, baroclinic_channel, williamson1  # noqa: F401
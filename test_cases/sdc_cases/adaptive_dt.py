@@ -0,0 +1,202 @@
+"""
+Adaptive time stepping for the SDC cases.
+
+The time step is chosen from the levels dt*2**l, for l between
+-max_halvings and max_doublings, where dt is the nominal time step of the
+case. Gusto's SDC fixes its dt-scaled quadrature coefficients when it is
+built, so a scheme is built for each level the first time it is used.
+
+Time is counted in units of the smallest level, and a step of any level is
+only started from a multiple of its length, so the run lands exactly on
+every dump time and on tmax.
+"""
+from math import floor, log2
+
+from gusto import Timestepper, logger
+
+
+class AdaptiveTimestepper(Timestepper):
+    """
+    Timestepper with its step size controlled by the error estimate of an SDC
+    scheme: the change made to the value at the final node by the last sweep.
+
+    A step with an estimate above `tolerance` is repeated with a smaller time
+    step, unless it is already at the smallest level. After an accepted step,
+    the time step is doubled if the estimate suggests that the error would
+    still be within the tolerance.
+
+    Args:
+        equation (:class:`PrognosticEquationSet`): the prognostic equations.
+        make_scheme (func): function with no arguments returning a new SDC
+            scheme, with error estimation enabled, for the current value of
+            the domain's time step.
+        io (:class:`IO`): the model's IO object. Field output is written every
+            `dump_interval`, and checkpoints with each dump.
+        transport_methods (iter): the transport methods of the equations.
+        tolerance (float): the largest accepted error estimate of a step.
+        dump_interval (float): the time between field output dumps, which
+            must be a multiple of the largest time step.
+        max_halvings (int, optional): the number of times the nominal time
+            step can be halved. Defaults to 3.
+        max_doublings (int, optional): the number of times the nominal time
+            step can be doubled. Defaults to 2.
+        **kwargs: further arguments for gusto's `Timestepper`.
+    """
+
+    # Safety factor applied to the step size suggested by the error estimate
+    safety = 0.9
+
+    def __init__(self, equation, make_scheme, io, transport_methods, tolerance,
+                 dump_interval, max_halvings=3, max_doublings=2, **kwargs):
+        self.make_scheme = make_scheme
+        self.tolerance = tolerance
+        self.min_level = -max_halvings
+        self.max_level = max_doublings
+        self.dt_nominal = float(equation.domain.dt)
+        self.dt_min = self.dt_nominal/2**max_halvings
+
+        self.dump_ticks = self.to_ticks(dump_interval)
+        if self.dump_ticks % self.level_ticks(self.max_level) != 0:
+            raise ValueError(f'The dump interval {dump_interval} is not a '
+                             + 'multiple of the largest time step '
+                             + f'{self.level_dt(self.max_level)}')
+
+        # Output is written at the dump times by `run`, rather than by step
+        io.output.dumpfreq = 1
+        io.output.chkptfreq = 1
+
+        scheme = make_scheme()
+        super().__init__(equation, scheme, io, transport_methods, **kwargs)
+        self.schemes = {0: scheme}
+        self.level = 0
+        # Number of accepted and rejected steps at each level
+        self.accepted = {}
+        self.rejected = {}
+
+    def to_ticks(self, t):
+        """Convert a time to a whole number of the smallest time steps."""
+        ticks = round(t/self.dt_min)
+        if abs(ticks*self.dt_min - t) > 1e-8*max(abs(t), self.dt_min):
+            raise ValueError(f'Time {t} is not a multiple of the smallest '
+                             + f'time step {self.dt_min}')
+        return ticks
+
+    def level_ticks(self, level):
+        """Length of a step of time step level `level`, in smallest steps."""
+        return 2**(level - self.min_level)
+
+    def level_dt(self, level):
+        return self.dt_nominal*2.**level
+
+    def set_level(self, level):
+        """Make the scheme of time step level `level` the current one."""
+        self.equation.domain.dt.assign(self.level_dt(level))
+        if level not in self.schemes:
+            logger.info(f'Setting up SDC for dt={self.level_dt(level)}')
+            scheme = self.make_scheme()
+            scheme.setup(self.equation)
+            self.setup_transporting_velocity(scheme)
+            self.schemes[level] = scheme
+        if self.schemes[level] is not self.scheme:
+            # Its previous step was not the one just taken
+            self.schemes[level].reset_history()
+        self.scheme = self.schemes[level]
+        self.level = level
+
+    def allowed_level(self, level, ticks, end_ticks):
+        """
+        The largest level no larger than `level` with a step that starts at a
+        multiple of its length and does not pass the end of the run.
+        """
+        while level > self.min_level and (
+                ticks % self.level_ticks(level) != 0
+                or ticks + self.level_ticks(level) > end_ticks):
+            level -= 1
+        return level
+
+    def step_factor(self, error):
+        """The change in step size suggested by the error estimate."""
+        if error == 0:
+            return float('inf')
+        return self.safety*(self.tolerance/error)**(1/(self.scheme.maxk + 1))
+
+    def timestep(self):
+        """
+        Take a step with the current level, repeating it with smaller levels
+        while its error estimate is above the tolerance.
+
+        Returns:
+            int: the level proposed for the next step.
+        """
+        while True:
+            super().timestep()
+            error = self.scheme.error
+            factor = self.step_factor(error)
+            if error <= self.tolerance or self.level == self.min_level:
+                break
+            self.rejected[self.level] = self.rejected.get(self.level, 0) + 1
+            logger.info(f'Rejected step with dt={self.level_dt(self.level)}, '
+                        + f'error estimate {error:.3e}')
+            # Halve at least once, or as often as the estimate suggests
+            self.set_level(max(self.min_level,
+                               self.level + min(-1, floor(log2(factor)))))
+
+        self.accepted[self.level] = self.accepted.get(self.level, 0) + 1
+        logger.info(f'Accepted step with dt={self.level_dt(self.level)}, '
+                    + f'error estimate {error:.3e}')
+        if factor >= 2:
+            return min(self.level + 1, self.max_level)
+        return self.level
+
+    def run(self, t, tmax, pick_up=False):
+        """
+        Run the model from time `t` to `tmax`, which must be multiples of the
+        smallest time step.
+        """
+        if pick_up:
+            raise ValueError('Runs with adaptive time steps cannot be picked '
+                             + 'up from a checkpoint')
+
+        # The same set up as gusto's Timestepper.run
+        self.io.setup_diagnostics(self.fields)
+        self.io.setup_log_courant(self.fields)
+        if self.equation.domain.mesh.extruded:
+            self.io.setup_log_courant(self.fields, component='horizontal')
+            self.io.setup_log_courant(self.fields, component='vertical')
+        if self.transporting_velocity != "prognostic":
+            self.io.setup_log_courant(self.fields, name='transporting_velocity',
+                                      expression=self.transporting_velocity)
+
+        self.step = 1
+        self.io.setup_dump(self.fields, t, pick_up)
+        self.t.assign(t)
+
+        ticks = self.to_ticks(t)
+        end_ticks = self.to_ticks(tmax)
+        level = self.level
+        while ticks < end_ticks:
+            self.set_level(self.allowed_level(level, ticks, end_ticks))
+            logger.info(f'at start of timestep {self.step}, t={float(self.t)}, '
+                        + f'dt={self.level_dt(self.level)}')
+
+            self.x.update()
+            self.io.log_courant(self.fields)
+            if self.equation.domain.mesh.extruded:
+                self.io.log_courant(self.fields, component='horizontal',
+                                    message='horizontal')
+                self.io.log_courant(self.fields, component='vertical',
+                                    message='vertical')
+
+            level = self.timestep()
+
+            ticks += self.level_ticks(self.level)
+            self.t.assign(ticks*self.dt_min)
+            self.step += 1
+
+            if ticks % self.dump_ticks == 0 or ticks == end_ticks:
+                self.io.dump(self.fields, float(self.t), self.step)
+
+        for level in sorted(self.accepted):
+            logger.info(f'dt={self.level_dt(level)}: {self.accepted[level]} steps '
+                        + f'accepted, {self.rejected.get(level, 0)} rejected')
+        logger.info(f'TIMELOOP complete. t={float(self.t)}, tmax={tmax}')
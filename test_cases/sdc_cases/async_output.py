@@ -0,0 +1,156 @@
+"""
+Field output written by a dedicated process, so that the time stepping does
+not wait for it.
+
+gusto gathers each output field to rank 0, which writes it to
+field_output.nc while every other process waits for it, so the stall at
+each dump grows with the number of processes. Here one process of the run
+is set aside to write the field output, and the others build and step the
+model. gusto still creates the file and decides when to dump, but at each
+dump every stepping process copies the values it owns of the fields to dump,
+diagnostics included, into a staging buffer, and sends it to the writer
+without waiting for it to arrive. At most `max_pending` buffers of a process
+are in flight, and a dump that would need another first waits for the
+oldest to be received. The writer builds nothing of the model: it joins the
+parts of each field in order of rank, the order in which gusto gathers them,
+and appends them to the file. The run ends once all of the output has been
+written.
+
+The checkpoints are still written by the stepping processes, as the mesh is
+needed to write one and each process already writes its own part of it.
+"""
+from collections import deque
+from math import isclose
+import os
+import time
+
+from firedrake import COMM_WORLD
+from gusto import logger
+from mpi4py import MPI
+from netCDF4 import Dataset
+import numpy as np
+
+from .probes import ProbeOutput
+from .registry import case_config, close_solver_log, finish_output, setup_case
+
+
+class OutputSender(object):
+    """
+    Sends the field output of a stepping process to the writer, in place of
+    the gathered write of gusto's IO object.
+
+    Args:
+        io (:class:`IO`): the IO object of the case.
+        comm (:class:`MPI.Comm`): the communicator of the whole run.
+        writer (int): the rank in `comm` of the writer.
+        max_pending (int, optional): the number of sends that can be in
+            flight at once. Defaults to 2.
+    """
+
+    def __init__(self, io, comm, writer, max_pending=2):
+        self.io = io
+        self.comm = comm
+        self.writer = writer
+        self.max_pending = max_pending
+        self.pending = deque()
+        # The time of the last fields sent
+        self.sent_time = None
+
+    def write_nc_dump(self, t):
+        """Send the values owned by this process of the fields at time `t`."""
+        if len(self.pending) == self.max_pending:
+            MPI.Request.Wait(self.pending.popleft())
+        # The message is pickled when it is sent, which copies the values
+        message = {'filename': os.path.join(self.io.dumpdir, 'field_output.nc'),
+                   't': t,
+                   'fields': {field.name(): field.dat.data_ro
+                              for field in self.io.to_dump}}
+        self.pending.append(self.comm.isend(message, dest=self.writer))
+        self.sent_time = t
+
+    def close(self):
+        """Tell the writer that the run has ended, once it has all of the
+        output."""
+        self.comm.send(None, dest=self.writer)
+        MPI.Request.Waitall(list(self.pending))
+        self.pending.clear()
+
+
+def write_output(comm, senders):
+    """
+    Write the field output sent by the stepping processes, until they end
+    the run.
+
+    Args:
+        comm (:class:`MPI.Comm`): the communicator of the whole run.
+        senders (int): the number of stepping processes, which are the ranks
+            before the writer.
+    """
+    while True:
+        parts = [comm.recv(source=rank) for rank in range(senders)]
+        if parts[0] is None:
+            break
+        with Dataset(parts[0]['filename'], 'a') as nc:
+            index = len(nc.dimensions['time'])
+            nc['time'][index] = parts[0]['t']
+            for name in parts[0]['fields']:
+                nc[name]['field_values'][:, index] = np.concatenate(
+                    [part['fields'][name] for part in parts])
+
+
+def run_with_output_member(name, max_pending=2, **overrides):
+    """
+    Set up and run case `name`, with the last process writing the field
+    output and the others stepping the model.
+
+    Args:
+        name (str): the case name.
+        max_pending (int, optional): the number of dumps of each stepping
+            process that can be in flight at once. Defaults to 2.
+        **overrides: the settings of the case. The 'comm' setting, which
+            needs at least two processes, is split between the stepping
+            processes and the writer.
+
+    Returns:
+        :class:`Timestepper`: the stepper, or None on the writer.
+    """
+    comm = overrides.pop('comm', COMM_WORLD)
+    if comm.size < 2:
+        raise ValueError('Need at least two processes to write the output '
+                         'from a process of its own')
+    writer = comm.size - 1
+    model_comm = comm.Split(color=int(comm.rank == writer), key=comm.rank)
+
+    stepper = None
+    if comm.rank != writer:
+        stepper, tmax = setup_case(name, comm=model_comm, **overrides)
+        pick_up = case_config(name, **overrides).get('resume', False)
+        io = stepper.io.io if isinstance(stepper.io, ProbeOutput) else stepper.io
+        sender = OutputSender(io, comm, writer, max_pending)
+        # gusto calls this from its dumps, after computing the diagnostics
+        io.write_nc_dump = sender.write_nc_dump
+
+        start_time = time.time()
+        stepper.run(t=0, tmax=tmax, pick_up=pick_up)
+        end_time = time.time()
+        sender.close()
+        close_solver_log(stepper)
+        print("Time taken:", end_time - start_time)
+
+        # Runs whose dumps fall on the end time, such as the convergence
+        # runs, must have sent the fields at it
+        dt = float(stepper.equation.domain.dt)
+        if (io.output.dump_nc and round(tmax/dt) % io.output.dumpfreq == 0
+                and (sender.sent_time is None
+                     or not isclose(sender.sent_time, tmax, rel_tol=1e-9))):
+            logger.warning(f'The last output sent was at t = {sender.sent_time}, '
+                           f'not at the end time {tmax}')
+        sweep_counts = getattr(stepper.scheme, 'sweep_counts', None)
+        if sweep_counts:
+            print("Mean SDC sweeps per step:", sum(sweep_counts)/len(sweep_counts))
+    else:
+        write_output(comm, comm.size - 1)
+
+    # The layout is applied once the writer has finished
+    finish_output(case_config(name, comm=comm, **overrides))
+    return stepper
@@ -0,0 +1,168 @@
+"""
+Tuning of the Newton-Krylov options of the SDC node solves for each case.
+
+A shortened run of a case is timed with the shared solver parameters, and
+then with each of the options of a search space changed in turn, keeping a
+change whenever it makes the run faster (a coordinate search). The SNES and
+KSP iterations of each trial are read from its solver log. The best options
+found for each case are written to a JSON file, which `load_solver_options`
+reads so that `nl_solver_parameters` uses them for that case.
+
+The runs are shortened by taking a few time steps, rather than by coarsening
+the mesh, as the best options depend on the size of the problem.
+"""
+from hashlib import sha256
+import json
+import math
+import os
+import shutil
+from time import perf_counter
+
+from firedrake import COMM_WORLD
+from firedrake.exceptions import ConvergenceError
+from mpi4py import MPI
+
+from .common import set_solver_options, nl_solver_parameters, option_path
+from .registry import run_case
+from .solver_log import log_filename
+
+# Options to search over, by their dotted paths in the solver parameters, with
+# those of the patch solves under `patch_prefix` so that they apply to either
+# preconditioner
+search_space = {
+    'ksp_ew_rtol0': [1e-1, 1e-2, 1e-3],
+    'ksp_ew_threshold': [1e-1, 1e-2],
+    'snes_lag_preconditioner': [-2, 1],
+    'ksp_gmres_restart': [30, 100],
+    'ksp_max_it': [100, 400],
+    'patch.pc_factor_mat_ordering_type': ['rcm', 'nd', 'natural'],
+    'patch.pc_factor_fill': [1.0, 1.2, 2.0],
+}
+
+# PETSc's defaults of the options in the search space that the shared
+# parameters leave unset, so that these are not tried as if they were new
+petsc_defaults = {
+    'ksp_gmres_restart': 30,
+}
+
+# Settings of the shortened runs of the cases that use the Newton solver
+reduced_settings = {
+    'gravity_wave': {'tmax': 240., 'dumpfreq': 20},
+    'moist_bf': {'tmax': 10., 'dumpfreq': 10},
+    'baroclinic_channel': {'tmax': 4*1800., 'dumpfreq': 4},
+}
+
+tuning_dirname = 'autotune'
+
+
+def get_option(parameters, path):
+    """The value of the option at dotted `path`, or None if it is not set."""
+    for key in path.split('.'):
+        if not isinstance(parameters, dict) or key not in parameters:
+            return None
+        parameters = parameters[key]
+    return parameters
+
+
+def read_iterations(dirname):
+    """Total SNES and KSP iterations of the node solves in a run's log."""
+    snes_its = ksp_its = 0
+    with open(os.path.join('results', dirname, log_filename)) as f:
+        header = f.readline().strip().split(',')
+        for line in f:
+            row = dict(zip(header, line.strip().split(',')))
+            if row['stage'] == 'solve':
+                snes_its += int(row['snes_its'])
+                ksp_its += int(row['ksp_its'])
+    return snes_its, ksp_its
+
+
+def run_trial(name, options, settings, comm=COMM_WORLD):
+    """
+    Time a run of case `name` with the solver `options`.
+
+    Returns:
+        dict: the wall time of the run, which is infinite if a solve failed,
+            and its total SNES and KSP iterations.
+    """
+    set_solver_options(name, options)
+    key = sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+    dirname = os.path.join(tuning_dirname, name, key)
+    if comm.rank == 0:
+        shutil.rmtree(os.path.join('results', dirname), ignore_errors=True)
+    comm.Barrier()
+
+    start = perf_counter()
+    try:
+        run_case(name, dirname=dirname, solver_log=True, comm=comm, **settings)
+        failed = False
+    except ConvergenceError:
+        failed = True
+    elapsed = comm.allreduce(perf_counter() - start, op=MPI.MAX)
+    failed = comm.allreduce(failed, op=MPI.LOR)
+
+    if failed:
+        return {'time': math.inf, 'snes_its': None, 'ksp_its': None}
+    snes_its, ksp_its = comm.bcast(
+        read_iterations(dirname) if comm.rank == 0 else None, root=0)
+    return {'time': elapsed, 'snes_its': snes_its, 'ksp_its': ksp_its}
+
+
+def tune_case(name, space=search_space, comm=COMM_WORLD, **settings):
+    """
+    Search for the fastest solver options for case `name`.
+
+    Args:
+        name (str): the case name.
+        space (dict, optional): the values to try for each option, by its
+            dotted path. Defaults to `search_space`.
+        comm (:class:`MPI.Comm`, optional): the communicator to run on.
+        **settings: settings of the case, overriding `reduced_settings`.
+
+    Returns:
+        dict: the best options found, with the time and iterations of the
+            run with them and of the run with the shared parameters.
+    """
+    settings = dict(reduced_settings.get(name, {}), **settings)
+    preconditioner = settings.get('preconditioner', 'star')
+    defaults = nl_solver_parameters(preconditioner=preconditioner)
+
+    # The first run also compiles the forms, so it is not timed
+    run_trial(name, {}, settings, comm)
+    baseline = run_trial(name, {}, settings, comm)
+
+    best_options, best = {}, baseline
+    for path, values in space.items():
+        default = get_option(defaults, option_path(path, preconditioner))
+        if default is None:
+            default = petsc_defaults.get(path)
+        current = best_options.get(path, default)
+        for value in values:
+            if value == current:
+                continue
+            options = dict(best_options, **{path: value})
+            result = run_trial(name, options, settings, comm)
+            if comm.rank == 0:
+                print(f"{name}: {options} took {result['time']:.2f}s, "
+                      + f"{result['snes_its']} SNES and {result['ksp_its']} KSP iterations")
+            if result['time'] < best['time']:
+                best_options, best = options, result
+
+    set_solver_options(name, best_options)
+    return dict(options=best_options, baseline=baseline, **best)
+
+
+def write_solver_options(results, filename, comm=COMM_WORLD):
+    """
+    Write the tuned options of each case to `filename`, keeping the entries
+    of any other cases already in the file.
+    """
+    if comm.rank == 0:
+        tuned = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                tuned = json.load(f)
+        tuned.update(results)
+        with open(filename, 'w') as f:
+            json.dump(tuned, f, indent=2)
+    comm.Barrier()
@@ -0,0 +1,304 @@
+"""
+The dry baroclinic wave in a channel from the appendix of Ullrich, Reed &
+Jablonowski, 2015:
+``Analytical initial conditions and an analysis of baroclinic instability waves
+in f - and β-plane 3D channel models'', QJRMS.
+
+The setup here is for the order 1 finite elements, in a 3D slice which is
+periodic in the x direction but with rigid walls in the y direction.
+"""
+from firedrake import (
+    SpatialCoordinate, cos, sin, pi, sqrt, ln, exp, Constant, Function,
+    as_vector, errornorm, norm, COMM_WORLD
+)
+from gusto import (
+    Domain, CompressibleParameters, CompressibleEulerEquations,
+    OutputParameters, IO, logger, DGUpwind, compressible_hydrostatic_balance,
+    Perturbation, thermodynamics, Temperature, Pressure, SplitDGUpwind,
+    transport, split_continuity_form, Timestepper, XComponent, YComponent,
+    ZComponent, split_hv_advective_form, SUPGOptions, pick_up_mesh
+)
+
+from .adaptive_dt import AdaptiveTimestepper
+from .common import (
+    nl_solver_parameters, linear_solver_parameters, channel_mesh,
+    label_hv_imex, imex_sdc, extruded_mesh_name, resume_checkpoint
+)
+from .diagnostics import select_diagnostics
+from .initial_state import InitialStateCache
+from .parallel_nc import ParallelNetCDFIO
+from .registry import register_case
+from .solver_log import SolverLog
+
+baroclinic_channel_defaults = {
+    'nx': 160,                 # number of columns in x-direction
+    'ny': 24,                  # number of columns in y-direction
+    'nlayers': 20,             # number of layers in mesh
+    'dt': 1800,                # 30 minutes
+    'tmax': 24*60*60*12,       # 12 days
+    'dumpfreq': 48,            # Corresponds to every 1 day with default opts
+    'dirname': 'dry_baroclinic_channel_imex_sdc',
+    'quad_type': 'GAUSS',
+    'M': 2,
+    'k': 3,
+    'qdelta_imp': 'LU',
+    'qdelta_exp': 'FE',
+    'initial_guess': 'copy',   # 'copy', 'base' or 'extrapolate'
+    'sdc_tolerance': None,     # residual at which to stop sweeping
+    'inexact_sdc': None,       # node solve tolerance per unit residual
+    'pc_refresh_growth': None,  # Krylov iteration growth to rebuild the PC
+    'diagnostics': ['Temperature', 'Pressure_Vt'],  # diagnostic fields to output
+    'nc_layout': None,         # chunking and compression of the netCDF output
+    'nc_backend': 'gather',    # 'gather' to rank 0 or 'parallel' netCDF writes
+    'dt_tolerance': None,      # error estimate for adaptive time steps
+    'max_dt_halvings': 3,
+    'max_dt_doublings': 2,
+    'solver_log': False,       # write timings and solver iterations
+    'preconditioner': 'star',  # 'star' or 'column' patches
+    'hybridised': False,       # linear node solves about reference profiles
+    'operator': 'hybrid',      # representation of the node Jacobians
+    'initial_state_cache': True,  # reuse balanced states from earlier runs
+    'chkptfreq': None,
+    'resume': False,
+    'comm': COMM_WORLD
+}
+
+
+@register_case('baroclinic_channel', baroclinic_channel_defaults)
+def setup_baroclinic_channel(
+        nx, ny, nlayers, dt, tmax, dumpfreq, dirname, quad_type, M, k,
+        qdelta_imp, qdelta_exp, initial_guess, sdc_tolerance, inexact_sdc,
+        pc_refresh_growth, diagnostics, nc_layout, nc_backend, dt_tolerance,
+        max_dt_halvings, max_dt_doublings, solver_log, preconditioner,
+        hybridised, operator, initial_state_cache, chkptfreq, resume, comm
+):
+
+    # ------------------------------------------------------------------------ #
+    # Parameters for test case
+    # ------------------------------------------------------------------------ #
+    Lx = 4.0e7                   # length of domain in x direction, in m
+    Ly = 6.0e6                   # width of domain in y direction, in m
+    H = 3.0e4                    # height of domain, in m
+    omega = Constant(7.292e-5)   # planetary rotation rate, in 1/s
+    phi0 = Constant(pi/4)        # latitude of centre of channel, in radians
+    b = Constant(2)              # vertical width parameter, dimensionless
+    T0 = Constant(288.)          # reference temperature, in K
+    u0 = Constant(35.)           # reference zonal wind speed, in m/s
+    Gamma = Constant(0.005)      # lapse rate, in K/m
+    beta0 = Constant(0.0)        # beta-plane parameter, in 1/s
+    xc = 2.0e6                   # x coordinate for centre of perturbation, in m
+    yc = 2.5e6                   # y coordinate for centre of perturbation, in m
+    Lp = 6.0e5                   # width parameter for perturbation, in m
+    up = Constant(1.0)           # strength of wind perturbation, in m/s
+
+    # ------------------------------------------------------------------------ #
+    # Our settings for this set up
+    # ------------------------------------------------------------------------ #
+    element_order = 1
+    u_eqn_type = 'vector_advection_form'
+    max_iterations = 40          # max num of iterations for finding eta coords
+    tolerance = 1e-10            # tolerance of error in finding eta coords
+
+    # ------------------------------------------------------------------------ #
+    # Set up model objects
+    # ------------------------------------------------------------------------ #
+
+    # I/O. The nc_layout is given to the field output when the run ends.
+    output = OutputParameters(
+        dirname=dirname, dumpfreq=dumpfreq, dump_nc=True, dump_vtus=False,
+        checkpoint=True, checkpoint_method="checkpointfile",
+        chkptfreq=dumpfreq if chkptfreq is None else chkptfreq,
+        checkpoint_pickup_filename=resume_checkpoint(dirname, resume, comm)
+    )
+
+    # The balanced initial state, if it has been cached before
+    state_cache = None
+    if initial_state_cache and not resume:
+        state_cache = InitialStateCache(
+            'baroclinic_channel',
+            dict(nx=nx, ny=ny, nlayers=nlayers, Lx=Lx, Ly=Ly, H=H,
+                 omega=float(omega), phi0=float(phi0), b=float(b), T0=float(T0),
+                 u0=float(u0), Gamma=float(Gamma), beta0=float(beta0), xc=xc,
+                 yc=yc, Lp=Lp, up=float(up), element_order=element_order,
+                 max_iterations=max_iterations, tolerance=tolerance),
+            comm=comm)
+
+    # Domain
+    if resume:
+        mesh = pick_up_mesh(output, extruded_mesh_name, comm=comm)
+    elif state_cache is not None and state_cache.exists:
+        mesh = state_cache.load_mesh()
+    else:
+        mesh = channel_mesh(nx, ny, nlayers, Lx, Ly, H, comm=comm)
+    domain = Domain(mesh, dt, "RTCF", element_order)
+    x, y, z = SpatialCoordinate(mesh)
+
+    # Equation
+    params = CompressibleParameters(mesh=mesh, Omega=omega*sin(phi0))
+    eqns = CompressibleEulerEquations(
+        domain, params, u_transport_option=u_eqn_type,
+        no_normal_flow_bc_ids=[1, 2]
+    )
+
+    # Check number of optimal cores
+    print("Opt Cores:", eqns.X.function_space().dim()/50000.)
+
+    eqns = split_continuity_form(eqns)
+    eqns = split_hv_advective_form(eqns, "rho")
+    eqns = split_hv_advective_form(eqns, "theta")
+    label_hv_imex(eqns)
+
+    opts = SUPGOptions(suboptions={"theta": [transport]})
+
+    # Diagnostics
+    diagnostic_fields = select_diagnostics({
+        'theta_perturbation': (lambda: Perturbation('theta'), []),
+        'Temperature': (lambda: Temperature(eqns), []),
+        'Pressure_Vt': (lambda: Pressure(eqns), []),
+        'u_x': (lambda: XComponent('u'), []),
+        'u_y': (lambda: YComponent('u'), []),
+        'u_z': (lambda: ZComponent('u'), [])
+    }, diagnostics)
+    if nc_backend == 'parallel':
+        io = ParallelNetCDFIO(domain, output, diagnostic_fields=diagnostic_fields)
+    else:
+        io = IO(domain, output, diagnostic_fields=diagnostic_fields)
+
+    transport_methods = [DGUpwind(eqns, "u"),
+                         SplitDGUpwind(eqns, "rho"),
+                         SplitDGUpwind(eqns, "theta", ibp=SUPGOptions.ibp)]
+
+    # IMEX time stepper
+    log = SolverLog(dirname, comm) if solver_log else None
+
+    def make_scheme():
+        return imex_sdc(domain, M, k, quad_type, qdelta_imp, qdelta_exp,
+                        final_update=True, initial_guess=initial_guess,
+                        options=opts,
+                        nonlinear_solver_parameters=nl_solver_parameters(
+                            'baroclinic_channel', preconditioner, operator),
+                        linear_solver_parameters=linear_solver_parameters(),
+                        tolerance=sdc_tolerance, inexact=inexact_sdc,
+                        refresh_growth=pc_refresh_growth,
+                        estimate_error=dt_tolerance is not None,
+                        solver_log=log, hybridised=hybridised)
+
+    # Time stepper
+    if dt_tolerance is None:
+        stepper = Timestepper(eqns, make_scheme(), io, transport_methods)
+    else:
+        stepper = AdaptiveTimestepper(eqns, make_scheme, io, transport_methods,
+                                      dt_tolerance, dumpfreq*dt,
+                                      max_halvings=max_dt_halvings,
+                                      max_doublings=max_dt_doublings)
+
+    if resume:
+        # Fields, reference profiles, time and step are picked up by the run
+        return stepper
+
+    # ------------------------------------------------------------------------ #
+    # Initial conditions
+    # ------------------------------------------------------------------------ #
+
+    # Physical parameters
+    Rd = params.R_d
+    f0 = 2 * omega * sin(phi0)
+    y0 = Constant(Ly / 2)
+    g = params.g
+    p0 = params.p_0
+
+    # Initial conditions
+    u = stepper.fields("u")
+    rho = stepper.fields("rho")
+    theta = stepper.fields("theta")
+
+    # spaces
+    Vu = u.function_space()
+    Vt = theta.function_space()
+    Vr = rho.function_space()
+
+    # mean fields
+    rho_b = Function(Vr)
+    u_b = stepper.fields("ubar", space=Vu, dump=False)
+    theta_b = Function(Vt)
+    initial_state = {'u': u, 'rho': rho, 'theta': theta, 'ubar': u_b,
+                     'rho_b': rho_b, 'theta_b': theta_b}
+
+    if state_cache is not None and state_cache.exists:
+        state_cache.load(initial_state)
+    else:
+        # set up background state expressions
+        eta = Function(Vt).interpolate(Constant(1e-7))
+        Phi = Function(Vt).interpolate(g * z)
+        T = Function(Vt)
+        Phi_prime = u0 / 2 * (
+            (f0 - beta0 * y0) * (y - (Ly / 2) - (Ly / (2 * pi)) * sin(2*pi*y/Ly))
+            + beta0 / 2*(
+                y**2 - (Ly * y / pi) * sin(2*pi*y/Ly)
+                - (Ly**2 / (2 * pi**2)) * cos(2*pi*y/Ly) - (Ly**2 / 3)
+                - (Ly**2 / (2 * pi**2))
+            )
+        )
+        Phi_expr = (
+            T0 * g / Gamma * (1 - eta ** (Rd * Gamma / g))
+            + Phi_prime * ln(eta) * exp(-(ln(eta) / b) ** 2)
+        )
+
+        Tv_expr = (
+            T0 * eta ** (Rd * Gamma / g) + Phi_prime / Rd * exp(-(ln(eta) / b)**2)
+            * ((2 / b**2) * (ln(eta)) ** 2 - 1)
+        )
+        u_expr = as_vector(
+            [-u0 * (sin(pi*y/Ly))**2 * ln(eta) * eta ** (-ln(eta) / b ** 2),
+             0.0, 0.0]
+        )
+        T_expr = Tv_expr
+
+        # do Newton method to obtain eta
+        eta_new = Function(Vt)
+        F = -Phi + Phi_expr
+        dF = -Rd * Tv_expr / eta
+        for _ in range(max_iterations):
+            eta_new.interpolate(eta - F/dF)
+            if errornorm(eta_new, eta) / norm(eta) < tolerance:
+                eta.assign(eta_new)
+                break
+            eta.assign(eta_new)
+
+        # make mean u and theta
+        u.project(u_expr)
+        T.interpolate(T_expr)
+        theta.interpolate(
+            thermodynamics.theta(params, T_expr, p0 * eta)
+        )
+        Phi_test = Function(Vt).interpolate(Phi_expr)
+        logger.info(
+            f"Error-norm for setting up p: {errornorm(Phi_test, Phi) / norm(Phi)}"
+        )
+
+        # Calculate hydrostatic fields
+        compressible_hydrostatic_balance(
+            eqns, theta, rho, solve_for_rho=True
+        )
+
+        # make mean fields
+        rho_b.assign(rho)
+        u_b.project(u)
+        theta_b.assign(theta)
+
+        # define perturbation
+        r = sqrt((x - xc) ** 2 + (y - yc) ** 2)
+        u_pert = Function(Vu).project(as_vector([up * exp(-(r / Lp)**2), 0.0, 0.0]))
+
+        # define initial u
+        u.assign(u_b+u_pert)
+
+        if state_cache is not None:
+            state_cache.save(mesh, initial_state)
+
+    # initialise fields
+    stepper.set_reference_profiles(
+        [('rho', rho_b), ('theta', theta_b)]
+    )
+
+    return stepper
@@ -0,0 +1,425 @@
+"""
+Pieces shared by all of the test cases: solver parameters (with any tuned
+options), the horizontally-explicit / vertically-implicit term labelling,
+construction of the IMEX-SDC scheme, a per-process cache of meshes and the
+location of checkpoints to resume from.
+
+The cache means that several runs of the same case in one process (e.g. a
+convergence sweep over dt) build the mesh once, and firedrake then reuses
+the function spaces and compiled kernels that hang off it.
+"""
+from copy import deepcopy
+from glob import glob
+import json
+import os
+
+from firedrake import (
+    PeriodicIntervalMesh, PeriodicRectangleMesh, CubedSphereMesh, ExtrudedMesh,
+    MeshHierarchy, ExtrudedMeshHierarchy, COMM_WORLD
+)
+from gusto import (
+    IMEX_Euler, SDC, time_derivative, transport, implicit, explicit,
+    horizontal_transport, vertical_transport
+)
+
+from .sdc import SweepSDC, AdaptiveSDC, ParallelSDC
+
+# ---------------------------------------------------------------------------- #
+# Solver parameters
+# ---------------------------------------------------------------------------- #
+
+_nl_solver_parameters = {
+    "snes_converged_reason": None,
+    "snes_lag_preconditioner_persists": None,
+    "snes_lag_preconditioner": -2,
+    "snes_lag_jacobian": -2,
+    "snes_lag_jacobian_persists": None,
+    'ksp_ew': None,
+    'ksp_ew_version': 1,
+    "ksp_ew_threshold": 1e-2,
+    "ksp_ew_rtol0": 1e-3,
+    "mat_type": "matfree",
+    "ksp_type": "gmres",
+    "ksp_converged_reason": None,
+    "ksp_atol": 1e-4,
+    "ksp_rtol": 1e-4,
+    "snes_atol": 1e-4,
+    "snes_rtol": 1e-4,
+    "ksp_max_it": 400,
+    "pc_type": "python",
+    "pc_python_type": "firedrake.AssembledPC",
+    "assembled": {
+        "pc_type": "python",
+        "pc_python_type": "firedrake.ASMStarPC",
+        "pc_star": {
+            "construct_dim": 0,
+            "sub_sub": {
+                "pc_type": "lu",
+                "pc_factor_mat_ordering_type": "rcm",
+                "pc_factor_reuse_ordering": None,
+                "pc_factor_reuse_fill": None,
+                "pc_factor_fill": 1.2
+            }
+        },
+    },
+}
+
+# Alternative to the vertex-star patches, for the vertically-implicit node
+# solves on extruded meshes: each patch is a whole column, above a cell or a
+# facet of the base mesh, so that the vertical coupling within a column is
+# solved directly
+_column_pc_parameters = {
+    "pc_type": "python",
+    "pc_python_type": "firedrake.ASMLinesmoothPC",
+    "pc_linesmooth": {
+        "codims": "0, 1",
+        "sub_sub": deepcopy(_nl_solver_parameters["assembled"]["pc_star"]["sub_sub"])
+    },
+}
+
+# Preconditioners for the assembled operator of the node solves
+preconditioners = ["star", "column"]
+
+# Geometric multigrid for the node solves, on a hierarchy of horizontally
+# coarsened meshes. The operator is rediscretised and assembled on each level
+# and smoothed by a few GMRES iterations preconditioned by the patches, which
+# makes the multigrid cycle nonlinear, so the outer Krylov method is FGMRES
+_mg_parameters = {
+    "ksp_type": "fgmres",
+    "pc_type": "mg",
+    "pc_mg_type": "multiplicative",
+    "pc_mg_cycle_type": "v",
+    "mg_levels": {
+        "ksp_type": "gmres",
+        "ksp_max_it": 3,
+        "ksp_convergence_test": "skip",
+    },
+    "mg_coarse": {
+        "ksp_type": "preonly",
+        "pc_type": "lu",
+        "pc_factor_mat_solver_type": "mumps",
+    },
+}
+
+# Representations of the Jacobian of the node solves. "hybrid" applies it
+# matrix-free in GMRES and assembles it only for the patch preconditioner,
+# "aij" and "baij" assemble it for both, and "matfree" never assembles it,
+# so can only precondition with its diagonal
+operators = ["hybrid", "matfree", "aij", "baij"]
+
+_linear_solver_parameters = {
+    'snes_type': 'ksponly',
+    'ksp_rtol': 1e-7,
+    'ksp_type': 'cg',
+    'pc_type': 'bjacobi',
+    'sub_pc_type': 'ilu'
+}
+
+
+# Tuned options for each case, as loaded by `load_solver_options`
+_tuned_options = {}
+
+# Tuned options of the patch solves have paths starting with this prefix, and
+# apply to the patches of whichever preconditioner is used
+patch_prefix = 'patch.'
+_patch_paths = {
+    "star": "assembled.pc_star.sub_sub.",
+    "column": "assembled.pc_linesmooth.sub_sub."
+}
+
+
+def option_path(path, preconditioner="star"):
+    """
+    The dotted path in the solver parameters with `preconditioner` of the
+    tuned option at `path`, which may be given with `patch_prefix` or with
+    the path of either layout of patches.
+    """
+    for prefix in [patch_prefix] + list(_patch_paths.values()):
+        if path.startswith(prefix):
+            return _patch_paths[preconditioner] + path[len(prefix):]
+    return path
+
+
+def set_option(parameters, path, value):
+    """
+    Set an option in a nested dictionary of solver parameters, where `path`
+    gives the keys separated by dots, e.g. 'assembled.pc_star.sub_sub.pc_factor_fill'.
+    """
+    *keys, name = path.split('.')
+    for key in keys:
+        parameters = parameters.setdefault(key, {})
+    parameters[name] = value
+
+
+def set_solver_options(case, options):
+    """
+    Use `options`, a dictionary of values by their dotted paths, in the
+    Newton-Krylov parameters of `case`, in place of any set before.
+    """
+    _tuned_options[case] = dict(options)
+
+
+def load_solver_options(filename):
+    """
+    Load the tuned solver options of each case from a file written by
+    `sdc_cases.autotune`, to be used by `nl_solver_parameters`.
+    """
+    with open(filename) as f:
+        tuned = json.load(f)
+    for case, result in tuned.items():
+        set_solver_options(case, result['options'])
+
+
+def nl_solver_parameters(case=None, preconditioner="star", operator="hybrid",
+                         multigrid=False):
+    """
+    Return a fresh copy of the Newton-Krylov parameters for the SDC nodes,
+    with any tuned options of `case` applied.
+
+    Args:
+        case (str, optional): the case to apply tuned options for.
+        preconditioner (str, optional): the preconditioner of the assembled
+            operator, which is either "star" for vertex-star patches or
+            "column" for vertical column patches on an extruded mesh.
+            Defaults to "star".
+        operator (str, optional): the representation of the Jacobian, one
+            of `operators`. Defaults to "hybrid".
+        multigrid (bool, optional): whether to precondition with geometric
+            multigrid, using the patches as smoothers, which needs the mesh
+            to be the finest of a hierarchy and the Jacobian to be assembled
+            ("hybrid" then means "aij"). Defaults to False.
+    """
+    parameters = deepcopy(_nl_solver_parameters)
+    if preconditioner == "column":
+        parameters["assembled"] = deepcopy(_column_pc_parameters)
+    elif preconditioner != "star":
+        raise ValueError(f'Preconditioner {preconditioner} not recognised, '
+                         + f'options are {preconditioners}')
+    for path, value in _tuned_options.get(case, {}).items():
+        set_option(parameters, option_path(path, preconditioner), value)
+
+    if multigrid:
+        if operator == "matfree":
+            raise ValueError('Multigrid needs an assembled Jacobian')
+        smoother = parameters.pop("assembled")
+        del parameters["pc_python_type"]
+        parameters.update(deepcopy(_mg_parameters))
+        parameters["mg_levels"].update(smoother)
+        parameters["mat_type"] = "aij" if operator == "hybrid" else operator
+    elif operator in ["aij", "baij"]:
+        # The patch preconditioner works on the Krylov operator itself
+        parameters.update(parameters.pop("assembled"))
+        parameters["mat_type"] = operator
+    elif operator == "matfree":
+        del parameters["assembled"]
+        del parameters["pc_python_type"]
+        parameters["pc_type"] = "jacobi"
+    elif operator != "hybrid":
+        raise ValueError(f'Operator {operator} not recognised, '
+                         + f'options are {operators}')
+    return parameters
+
+
+def linear_solver_parameters():
+    """Return a fresh copy of the parameters for the linear (mass) solves."""
+    return deepcopy(_linear_solver_parameters)
+
+
+# ---------------------------------------------------------------------------- #
+# Meshes
+# ---------------------------------------------------------------------------- #
+
+# Name under which firedrake stores an extruded mesh in a checkpoint file
+extruded_mesh_name = "firedrake_default_extruded"
+
+_mesh_cache = {}
+
+
+def cached_mesh(key, make_mesh):
+    """
+    Return the mesh stored under `key`, building it with `make_mesh()` the
+    first time it is requested.
+    """
+    if key not in _mesh_cache:
+        _mesh_cache[key] = make_mesh()
+    return _mesh_cache[key]
+
+
+def vertical_slice_mesh(ncolumns, nlayers, width, height, comm=COMM_WORLD):
+    """Periodic vertical slice mesh, cached per resolution and communicator."""
+    def make_mesh():
+        base_mesh = PeriodicIntervalMesh(ncolumns, width, comm=comm)
+        return ExtrudedMesh(base_mesh, layers=nlayers, layer_height=height/nlayers)
+
+    key = ('slice', ncolumns, nlayers, width, height, comm.py2f())
+    return cached_mesh(key, make_mesh)
+
+
+def vertical_slice_hierarchy(ncolumns, nlayers, width, height, levels,
+                             comm=COMM_WORLD):
+    """
+    Periodic vertical slice mesh that is the finest of a hierarchy for
+    geometric multigrid, with the columns halved `levels` times and the
+    layers kept on the coarser meshes. Cached like `vertical_slice_mesh`.
+    """
+    if ncolumns % 2**levels != 0:
+        raise ValueError(f'{ncolumns} columns cannot be halved {levels} times')
+
+    def make_mesh():
+        base_mesh = PeriodicIntervalMesh(ncolumns // 2**levels, width, comm=comm)
+        base_hierarchy = MeshHierarchy(base_mesh, levels)
+        hierarchy = ExtrudedMeshHierarchy(base_hierarchy, height,
+                                          base_layer=nlayers, refinement_ratio=1)
+        return hierarchy[-1]
+
+    key = ('slice_hierarchy', ncolumns, nlayers, width, height, levels, comm.py2f())
+    return cached_mesh(key, make_mesh)
+
+
+def multigrid_levels(ncolumns, max_levels):
+    """The most times, up to `max_levels`, that `ncolumns` can be halved."""
+    levels = 0
+    while levels < max_levels and ncolumns % 2**(levels+1) == 0:
+        levels += 1
+    return levels
+
+
+def channel_mesh(nx, ny, nlayers, Lx, Ly, height, comm=COMM_WORLD):
+    """3D channel, periodic in x with walls in y, cached per resolution."""
+    def make_mesh():
+        base_mesh = PeriodicRectangleMesh(nx, ny, Lx, Ly, "x",
+                                          quadrilateral=True, comm=comm)
+        return ExtrudedMesh(base_mesh, layers=nlayers, layer_height=height/nlayers)
+
+    key = ('channel', nx, ny, nlayers, Lx, Ly, height, comm.py2f())
+    return cached_mesh(key, make_mesh)
+
+
+def cubed_sphere_mesh(radius, ref_level, degree=2, comm=COMM_WORLD):
+    """Cubed sphere mesh, cached per refinement level."""
+    def make_mesh():
+        return CubedSphereMesh(radius=radius, refinement_level=ref_level,
+                               degree=degree, comm=comm)
+
+    key = ('cubed_sphere', radius, ref_level, degree, comm.py2f())
+    return cached_mesh(key, make_mesh)
+
+
+# ---------------------------------------------------------------------------- #
+# Checkpoints
+# ---------------------------------------------------------------------------- #
+
+def latest_checkpoint(dirname, comm=COMM_WORLD):
+    """
+    Return the path of the most recently written checkpoint file in the
+    output directory results/<dirname>. The file is chosen on rank 0, so
+    that all processes pick up from the same one.
+    """
+    if comm.rank == 0:
+        checkpoints = glob(os.path.join('results', dirname, 'chkpt*.h5'))
+        latest = max(checkpoints, key=os.path.getmtime) if checkpoints else None
+    else:
+        latest = None
+    latest = comm.bcast(latest, root=0)
+    if latest is None:
+        raise FileNotFoundError(f'No checkpoint to resume from in results/{dirname}')
+    return latest
+
+
+def resume_checkpoint(dirname, resume, comm=COMM_WORLD):
+    """
+    The checkpoint file to pick up from, for the `checkpoint_pickup_filename`
+    output parameter: the latest one in results/<dirname> if resuming, or
+    None for a fresh run.
+    """
+    return latest_checkpoint(dirname, comm=comm) if resume else None
+
+
+# ---------------------------------------------------------------------------- #
+# Time discretisation
+# ---------------------------------------------------------------------------- #
+
+def label_hv_imex(eqns, not_implicit=(time_derivative, transport),
+                  explicit_transport_first=False):
+    """
+    Label the terms of a horizontally/vertically split equation set so that
+    horizontal transport is explicit and vertical transport and all remaining
+    (non-time-derivative) terms are implicit.
+
+    Args:
+        eqns: the equation set, after `split_hv_advective_form`.
+        not_implicit (tuple): labels of terms that are not made implicit by
+            the first pass. Defaults to (time_derivative, transport).
+        explicit_transport_first (bool): if True, all transport terms are
+            first labelled explicit before the horizontal/vertical split is
+            applied. This is the labelling used by the convergence runs.
+    """
+    eqns.label_terms(lambda t: not any(t.has_label(*not_implicit)), implicit)
+    if explicit_transport_first:
+        eqns.label_terms(lambda t: t.has_label(transport), explicit)
+    eqns.label_terms(lambda t: t.has_label(transport) and t.has_label(horizontal_transport), explicit)
+    eqns.label_terms(lambda t: t.has_label(transport) and t.has_label(vertical_transport), implicit)
+    eqns.label_terms(lambda t: t.has_label(transport) and not any(t.has_label(horizontal_transport, vertical_transport)), explicit)
+
+
+def imex_sdc(domain, M, k, quad_type, qdelta_imp="LU", qdelta_exp="FE",
+             node_type="LEGENDRE", final_update=True, initial_guess="copy",
+             options=None, nonlinear_solver_parameters=None,
+             linear_solver_parameters=None, ensemble=None, tolerance=None,
+             estimate_error=False, solver_log=None, hybridised=False,
+             inexact=None, refresh_growth=None):
+    """
+    Build the Z2N IMEX-SDC scheme used throughout the paper, with IMEX Euler
+    as the base scheme.
+
+    If an `ensemble` with one member per node is given, the node solves of
+    each sweep are made in parallel across its members, which requires
+    diagonal Qdelta matrices. If a `tolerance` is given, each step stops
+    sweeping once the relative collocation residual is below it, making at
+    most k sweeps. With `estimate_error`, the scheme stores an estimate of
+    the error of each step, for adaptive time stepping. If a `solver_log`
+    (a :class:`SolverLog`) is given, the timings and solver iterations of
+    each stage of each step are recorded in it. With `hybridised`, each node
+    solve is a single hybridised linear solve about the reference profiles,
+    which must then be set on the time stepper. An `initial_guess` of
+    "extrapolate" starts each step from the previous step's collocation
+    polynomial. If `inexact` is given, the Newton solves of all but the last
+    sweep stop at that factor times the collocation residual. With a
+    `refresh_growth`, the Jacobian and preconditioner of a node solver are
+    rebuilt once its Krylov iterations grow by that factor.
+    """
+    base_scheme = IMEX_Euler(domain, options=options,
+                             nonlinear_solver_parameters=nonlinear_solver_parameters,
+                             linear_solver_parameters=linear_solver_parameters)
+    sdc_args = (base_scheme, domain, M, k, quad_type, node_type, qdelta_imp,
+                qdelta_exp)
+    sdc_kwargs = dict(formulation="Z2N", options=options,
+                      nonlinear_solver_parameters=nonlinear_solver_parameters,
+                      linear_solver_parameters=linear_solver_parameters,
+                      final_update=final_update, initial_guess=initial_guess)
+
+    if ensemble is not None:
+        if tolerance is not None or estimate_error or inexact is not None:
+            raise ValueError('Sweeping to a tolerance, inexact sweeps and error '
+                             + 'estimates are not supported with parallel node '
+                             + 'solves')
+        if initial_guess == "extrapolate":
+            # Each member only has the values at its own node
+            raise ValueError('Extrapolated initial guesses are not supported '
+                             + 'with parallel node solves')
+        scheme = ParallelSDC(ensemble, *sdc_args, **sdc_kwargs)
+    elif tolerance is not None:
+        scheme = AdaptiveSDC(*sdc_args, tolerance, **sdc_kwargs)
+    elif (estimate_error or solver_log is not None or hybridised
+          or qdelta_imp == "MIN-SR-FLEX" or initial_guess == "extrapolate"
+          or inexact is not None or refresh_growth is not None):
+        # SweepSDC keeps a node solver for each sweep's MIN-SR-FLEX coefficients
+        scheme = SweepSDC(*sdc_args, **sdc_kwargs)
+    else:
+        return SDC(*sdc_args, **sdc_kwargs)
+    scheme.estimate_error = estimate_error
+    scheme.solver_log = solver_log
+    scheme.hybridised = hybridised
+    scheme.inexact = inexact
+    scheme.refresh_growth = refresh_growth
+    return scheme
@@ -0,0 +1,88 @@
+"""
+Diagnostic fields computed on demand.
+
+Each diagnostic field allocates a Function and is computed, usually by a
+projection, at every dump. The cases therefore list the diagnostics they can
+output, by the name of the field they make, and only set up those named in
+their 'diagnostics' setting, together with any diagnostics these are
+computed from. Any of the others can be computed after the run from its
+latest checkpoint, with `regenerate_diagnostics`.
+"""
+import os
+
+from firedrake import CheckpointFile
+
+from .registry import case_config, setup_case
+
+results_dir = 'results'
+diagnostics_file = 'diagnostics.h5'
+
+
+def select_diagnostics(available, names):
+    """
+    Build the diagnostic fields named in `names`, preceded by those they are
+    computed from.
+
+    Args:
+        available (dict): for each diagnostic field name, a pair of a
+            function returning the diagnostic and a list of the names of the
+            diagnostic fields it is computed from.
+        names (iter): the names of the diagnostic fields to output.
+
+    Returns:
+        list: the diagnostics, each after those it is computed from.
+    """
+    unknown = set(names) - set(available)
+    if unknown:
+        raise ValueError(f'Unknown diagnostics {sorted(unknown)}, options are '
+                         f'{sorted(available)}')
+
+    ordered = []
+
+    def add(name):
+        if name in ordered:
+            return
+        _, requires = available[name]
+        for required in requires:
+            add(required)
+        ordered.append(name)
+
+    for name in names:
+        add(name)
+    return [available[name][0]() for name in ordered]
+
+
+def regenerate_diagnostics(name, diagnostics, **overrides):
+    """
+    Compute diagnostic fields from the latest checkpoint of a run of case
+    `name`, and write them with their mesh to diagnostics.h5 in the run's
+    output directory, from where they can be read like the checkpoint.
+
+    Args:
+        name (str): the case name.
+        diagnostics (list): the names of the diagnostic fields to compute.
+        **overrides: the settings of the run.
+
+    Returns:
+        float: the time of the checkpoint.
+    """
+    overrides['resume'] = True
+    overrides['diagnostics'] = diagnostics
+    config = case_config(name, **overrides)
+    stepper, _ = setup_case(name, **overrides)
+    io = stepper.io
+
+    picked_up = io.pick_up_from_checkpoint(stepper.fields)
+    t, reference_profiles = picked_up[0], picked_up[1]
+    stepper.set_reference_profiles(reference_profiles)
+    io.setup_diagnostics(stepper.fields)
+    for diagnostic in io.diagnostic_fields:
+        diagnostic.compute()
+
+    filename = os.path.join(results_dir, config['dirname'], diagnostics_file)
+    with CheckpointFile(filename, 'w', comm=config['comm']) as chk:
+        chk.save_mesh(stepper.equation.domain.mesh)
+        for diagnostic in io.diagnostic_fields:
+            chk.save_function(stepper.fields(diagnostic.name))
+        chk.set_attr('/', 'time', t)
+    return t
@@ -0,0 +1,83 @@
+"""
+Concurrent execution of a sweep of independent runs, each on its own
+sub-communicator of COMM_WORLD.
+
+The processes are shared out in proportion to the estimated cost of each run
+(its degrees of freedom times its number of steps), so that all members of
+the sweep finish at roughly the same time.
+"""
+from firedrake import COMM_WORLD
+
+from .registry import case_cost, run_case
+
+
+def allocate_ranks(costs, nranks):
+    """
+    Share `nranks` processes between members in proportion to their costs,
+    with at least one process per member.
+
+    Args:
+        costs (list): the relative cost of each member.
+        nranks (int): the total number of processes.
+
+    Returns:
+        list: the number of processes given to each member.
+    """
+    nmembers = len(costs)
+    if nranks < nmembers:
+        raise ValueError(f'Need at least one process per member, but have '
+                         f'{nranks} processes for {nmembers} members')
+
+    total = float(sum(costs))
+    shares = [nranks*cost/total for cost in costs]
+    sizes = [max(1, int(share)) for share in shares]
+
+    # Correct the rounding, taking from or giving to the members whose
+    # allocation is furthest from their share
+    while sum(sizes) > nranks:
+        i = max((i for i in range(nmembers) if sizes[i] > 1),
+                key=lambda i: sizes[i] - shares[i])
+        sizes[i] -= 1
+    while sum(sizes) < nranks:
+        i = max(range(nmembers), key=lambda i: shares[i] - sizes[i])
+        sizes[i] += 1
+
+    return sizes
+
+
+def split_comm(costs, comm=COMM_WORLD):
+    """
+    Split `comm` into one sub-communicator per member, sized by cost.
+
+    Returns:
+        tuple: the index of the member that this process belongs to, and the
+            sub-communicator of that member.
+    """
+    sizes = allocate_ranks(costs, comm.size)
+    first_rank = 0
+    for member, size in enumerate(sizes):
+        if comm.rank < first_rank + size:
+            break
+        first_rank += size
+    return member, comm.Split(color=member, key=comm.rank)
+
+
+def ensemble_run(runs, comm=COMM_WORLD):
+    """
+    Run a sweep of cases concurrently, each on a sub-communicator of `comm`.
+
+    Args:
+        runs (list): (name, overrides) pairs, one per member of the sweep.
+        comm (:class:`MPI.Comm`, optional): the communicator to split.
+            Defaults to COMM_WORLD.
+    """
+    costs = [case_cost(name, **overrides) for name, overrides in runs]
+    member, member_comm = split_comm(costs, comm)
+    name, overrides = runs[member]
+
+    if member_comm.rank == 0:
+        print(f"Member {member} ({name}, {overrides.get('dirname')}) "
+              f"on {member_comm.size} of {comm.size} processes")
+    run_case(name, comm=member_comm, **overrides)
+
+    comm.Barrier()
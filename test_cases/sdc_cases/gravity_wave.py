@@ -0,0 +1,286 @@
+"""
+The non-linear compressible Euler equations in the vertical slice gravity
+wave test case of Skamarock and Klemp, 1994:
+``Efficiency and Accuracy of the Klemp-Wilhelmson Time-Splitting Technique'',
+MWR.
+
+Potential temperature is transported using SUPG. The same setup is used for
+the example solution of Figure 2 and for the convergence runs.
+"""
+import numpy as np
+from firedrake import (
+    as_vector, SpatialCoordinate, exp, sin, Function, pi, COMM_WORLD
+)
+from gusto import (
+    Domain, IO, OutputParameters, DGUpwind, SUPGOptions, CourantNumber,
+    Perturbation, Gradient, CompressibleParameters, CompressibleEulerEquations,
+    compressible_hydrostatic_balance, RichardsonNumber, Timestepper,
+    split_continuity_form, transport, split_hv_advective_form, SplitDGUpwind,
+    pick_up_mesh
+)
+
+from .common import (
+    nl_solver_parameters, vertical_slice_mesh, vertical_slice_hierarchy,
+    label_hv_imex, imex_sdc, extruded_mesh_name, resume_checkpoint
+)
+from .diagnostics import select_diagnostics
+from .initial_state import InitialStateCache
+from .probes import PointProbes, ProbeOutput
+from .registry import register_case
+from .solver_log import SolverLog
+
+gravity_wave_defaults = {
+    'ncolumns': 150,
+    'nlayers': 10,
+    'dt': 12.0,
+    'tmax': 3000.,
+    'dumpfreq': 125,
+    'dirname': 'skamarock_klemp_nonhydrostatic',
+    'element_order': 1,
+    'quad_type': 'GAUSS',
+    'M': 2,
+    'k': 3,
+    'qdelta_imp': 'LU',
+    'qdelta_exp': 'FE',
+    'final_update': True,
+    'initial_guess': 'copy',
+    'explicit_transport_first': False,
+    'sdc_tolerance': None,
+    'inexact_sdc': None,
+    'pc_refresh_growth': None,
+    'diagnostics': ['theta_perturbation'],  # the diagnostic fields to output
+    'nc_layout': None,        # chunking and compression of the netCDF output
+    'probe_fields': [],       # fields to record along z = H/2 at every step
+    'solver_log': False,
+    'preconditioner': 'star',
+    'hybridised': False,
+    'operator': 'hybrid',
+    'initial_state_cache': True,
+    'multigrid_levels': 0,
+    'chkptfreq': None,
+    'resume': False,
+    'comm': COMM_WORLD
+}
+
+domain_width = 3.0e5      # Width of domain (m)
+domain_height = 1.0e4     # Height of domain (m)
+
+# SDC settings (M, k, initial_guess) of the convergence runs for each order
+convergence_sdc_settings = {
+    1: (2, 3, 'base'),
+    2: (3, 4, 'copy'),
+    3: (3, 5, 'copy'),
+    5: (4, 7, 'copy')
+}
+
+
+def convergence_dirname(order, ncolumns, dt):
+    """Output directory of a convergence run, as read by the Figure 2 script."""
+    deltax = domain_width/float(ncolumns)
+    return 'gravity_wave_imex_sdc_paper_o%s_dx_%s_dt_%s' % (order, deltax, dt)
+
+
+def convergence_config(order, ncolumns, dt, tmax=3000.0):
+    """
+    Settings of the gravity wave convergence runs at element order `order`,
+    with output only at the end of the run. Their errors are found from the
+    theta of the checkpoints, so no diagnostics are output.
+    """
+    M, k, initial_guess = convergence_sdc_settings[order]
+    return {
+        'ncolumns': int(ncolumns),
+        'nlayers': 10,
+        'dt': dt,
+        'tmax': tmax,
+        'dumpfreq': int(tmax/dt),
+        'dirname': convergence_dirname(order, ncolumns, dt),
+        'element_order': order,
+        'quad_type': 'RADAU-RIGHT',
+        'M': M,
+        'k': k,
+        'final_update': False,
+        'initial_guess': initial_guess,
+        'explicit_transport_first': True,
+        'diagnostics': []
+    }
+
+
+def gravity_wave_diagnostics(parameters, Tsurf):
+    """The diagnostics of the gravity wave, for `select_diagnostics`."""
+    return {
+        'CourantNumber': (CourantNumber, []),
+        'u_gradient': (lambda: Gradient('u'), []),
+        'theta_perturbation': (lambda: Perturbation('theta'), []),
+        'theta_perturbation_gradient': (lambda: Gradient('theta_perturbation'),
+                                        ['theta_perturbation']),
+        'rho_perturbation': (lambda: Perturbation('rho'), []),
+        'RichardsonNumber': (lambda: RichardsonNumber('theta', parameters.g/Tsurf), []),
+        'theta_gradient': (lambda: Gradient('theta'), [])
+    }
+
+
+def gravity_wave_cost(ncolumns, nlayers, dt, tmax, element_order, M, k,
+                      **kwargs):
+    """Relative cost of a run: degrees of freedom x steps x node solves."""
+    return ncolumns*nlayers*(element_order+1)**2*(tmax/dt)*M*k
+
+
+@register_case('gravity_wave', gravity_wave_defaults, cost=gravity_wave_cost)
+def setup_gravity_wave(
+        ncolumns, nlayers, dt, tmax, dumpfreq, dirname, element_order,
+        quad_type, M, k, qdelta_imp, qdelta_exp, final_update, initial_guess,
+        explicit_transport_first, sdc_tolerance, inexact_sdc,
+        pc_refresh_growth, diagnostics, nc_layout, probe_fields, solver_log,
+        preconditioner, hybridised, operator, initial_state_cache,
+        multigrid_levels, chkptfreq, resume, comm
+):
+
+    # ------------------------------------------------------------------------ #
+    # Test case parameters
+    # ------------------------------------------------------------------------ #
+
+    Tsurf = 300.              # Temperature at surface (K)
+    wind_initial = 20.        # Initial wind in x direction (m/s)
+    pert_width = 5.0e3        # Width parameter of perturbation (m)
+    deltaTheta = 1.0e-2       # Magnitude of theta perturbation (K)
+    N = 0.01                  # Brunt-Vaisala frequency (1/s)
+
+    u_eqn_type = 'vector_advection_form'
+
+    # ------------------------------------------------------------------------ #
+    # Set up model objects
+    # ------------------------------------------------------------------------ #
+
+    # I/O. The nc_layout is given to the field output when the run ends.
+    output = OutputParameters(dirname=dirname,
+                              dumpfreq=dumpfreq,
+                              checkpoint=True,
+                              dump_nc=True,
+                              dump_vtus=False,
+                              checkpoint_method="checkpointfile",
+                              chkptfreq=dumpfreq if chkptfreq is None else chkptfreq,
+                              checkpoint_pickup_filename=resume_checkpoint(dirname, resume, comm),
+                              dumplist=['u', 'theta', 'rho'])
+
+    # Multigrid needs the mesh hierarchy, which is neither stored in the
+    # checkpoints nor in the cache of initial states
+    if multigrid_levels > 0 and resume:
+        raise ValueError('Runs with multigrid cannot be picked up from a checkpoint')
+
+    # The balanced initial state, if it has been cached before
+    state_cache = None
+    if initial_state_cache and not resume and multigrid_levels == 0:
+        state_cache = InitialStateCache(
+            'gravity_wave',
+            dict(ncolumns=ncolumns, nlayers=nlayers, element_order=element_order,
+                 domain_width=domain_width, domain_height=domain_height,
+                 Tsurf=Tsurf, wind_initial=wind_initial, pert_width=pert_width,
+                 deltaTheta=deltaTheta, N=N),
+            comm=comm)
+
+    # Domain -- 3D volume mesh
+    if resume:
+        mesh = pick_up_mesh(output, extruded_mesh_name, comm=comm)
+    elif state_cache is not None and state_cache.exists:
+        mesh = state_cache.load_mesh()
+    elif multigrid_levels > 0:
+        mesh = vertical_slice_hierarchy(ncolumns, nlayers, domain_width,
+                                        domain_height, multigrid_levels,
+                                        comm=comm)
+    else:
+        mesh = vertical_slice_mesh(ncolumns, nlayers, domain_width,
+                                   domain_height, comm=comm)
+    domain = Domain(mesh, dt, "CG", element_order)
+
+    # Equation
+    parameters = CompressibleParameters(mesh=mesh)
+    eqns = CompressibleEulerEquations(domain, parameters, u_transport_option=u_eqn_type)
+    eqns = split_continuity_form(eqns)
+    eqns = split_hv_advective_form(eqns, "rho")
+    eqns = split_hv_advective_form(eqns, "theta")
+    opts = SUPGOptions(suboptions={"theta": [transport]})
+
+    print("Opt Cores:", eqns.X.function_space().dim()/50000.)
+
+    diagnostic_fields = select_diagnostics(
+        gravity_wave_diagnostics(parameters, Tsurf), diagnostics)
+    io = IO(domain, output, diagnostic_fields=diagnostic_fields)
+
+    # Transport schemes
+    transport_methods = [DGUpwind(eqns, "u"),
+                         SplitDGUpwind(eqns, "rho"),
+                         SplitDGUpwind(eqns, "theta", ibp=SUPGOptions.ibp)]
+
+    label_hv_imex(eqns, explicit_transport_first=explicit_transport_first)
+    scheme = imex_sdc(domain, M, k, quad_type, qdelta_imp, qdelta_exp,
+                      final_update=final_update, initial_guess=initial_guess,
+                      options=opts,
+                      nonlinear_solver_parameters=nl_solver_parameters(
+                          'gravity_wave', preconditioner, operator,
+                          multigrid=multigrid_levels > 0),
+                      tolerance=sdc_tolerance, inexact=inexact_sdc,
+                      refresh_growth=pc_refresh_growth,
+                      solver_log=SolverLog(dirname, comm) if solver_log else None,
+                      hybridised=hybridised)
+
+    # Time stepper
+    stepper = Timestepper(eqns, scheme, io, transport_methods)
+
+    # Point probes along the middle of the domain
+    if probe_fields:
+        points = [(x, domain_height/2.) for x in np.linspace(0., domain_width, 100)]
+        stepper.io = ProbeOutput(
+            io, PointProbes(mesh, points, probe_fields, dirname))
+
+    if resume:
+        # Fields, reference profiles, time and step are picked up by the run
+        return stepper
+
+    # ------------------------------------------------------------------------ #
+    # Initial conditions
+    # ------------------------------------------------------------------------ #
+
+    u0 = stepper.fields("u")
+    rho0 = stepper.fields("rho")
+    theta0 = stepper.fields("theta")
+
+    # spaces
+    Vt = domain.spaces("theta")
+    Vr = domain.spaces("DG")
+
+    theta_b = Function(Vt)
+    rho_b = Function(Vr)
+    initial_state = {'u': u0, 'rho': rho0, 'theta': theta0,
+                     'theta_b': theta_b, 'rho_b': rho_b}
+
+    if state_cache is not None and state_cache.exists:
+        state_cache.load(initial_state)
+    else:
+        # Thermodynamic constants required for setting initial conditions
+        # and reference profiles
+        g = parameters.g
+
+        x, z = SpatialCoordinate(mesh)
+
+        # N^2 = (g/theta)dtheta/dz => dtheta/dz = theta N^2g => theta=theta_0exp(N^2gz)
+        thetab = Tsurf*exp(N**2*z/g)
+
+        theta_b.interpolate(thetab)
+
+        # Calculate hydrostatic exner
+        compressible_hydrostatic_balance(eqns, theta_b, rho_b)
+
+        theta_pert = (
+            deltaTheta * sin(pi*z/domain_height)
+            / (1 + (x - domain_width/2)**2 / pert_width**2)
+        )
+        theta0.interpolate(theta_b + theta_pert)
+        rho0.assign(rho_b)
+        u0.project(as_vector([wind_initial, 0.0]))
+
+        if state_cache is not None:
+            state_cache.save(mesh, initial_state)
+
+    stepper.set_reference_profiles([('rho', rho_b), ('theta', theta_b)])
+
+    return stepper
@@ -0,0 +1,106 @@
+"""
+On-disk cache of the balanced initial states of the cases.
+
+Finding the hydrostatically balanced state of a case takes nonlinear solves,
+which for the 3D channel are a noticeable part of the start up of a run. The
+balanced initial fields and reference profiles are saved with their mesh in
+a CheckpointFile under results/initial_state_cache, named by a hash of the
+case and the settings that determine its initial state, and later runs with
+the same settings load them instead of solving again.
+
+A state loaded from a file can only be put on the mesh stored with it, so a
+case must take its mesh from the cache whenever the state is in it. Within
+one process the fields are also kept in memory, so that repeated runs of a
+configuration share the mesh, and the compiled kernels hanging off it.
+"""
+from hashlib import sha256
+import json
+import os
+from uuid import uuid4
+
+from firedrake import CheckpointFile, Function, COMM_WORLD
+
+from .common import cached_mesh, extruded_mesh_name
+
+results_dir = 'results'
+cache_dirname = 'initial_state_cache'
+
+# The mesh and fields of each state used in this process, by filename
+_states = {}
+
+
+class InitialStateCache(object):
+    """
+    The cached initial state of one configuration of a case.
+
+    Args:
+        name (str): the case name.
+        settings (dict): everything that the initial state depends on, such
+            as the mesh resolution, element order and physical parameters.
+        comm (:class:`MPI.Comm`, optional): the communicator of the run.
+            Defaults to COMM_WORLD.
+        write (bool, optional): whether this run writes the state to the
+            file, which should only be done by one of several runs holding
+            the same state at once. Defaults to True.
+    """
+
+    def __init__(self, name, settings, comm=COMM_WORLD, write=True):
+        content = {'case': name, 'settings': settings}
+        key = sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.filename = os.path.join(results_dir, cache_dirname, f'{name}_{key}.h5')
+        self.comm = comm
+        self.write = write
+        on_disk = comm.bcast(os.path.exists(self.filename) if comm.rank == 0
+                             else None, root=0)
+        self.exists = self.filename in _states or on_disk
+
+    def load_mesh(self):
+        """The mesh of the cached state."""
+        if self.filename in _states:
+            return _states[self.filename][0]
+
+        def load():
+            with CheckpointFile(self.filename, 'r', comm=self.comm) as chk:
+                return chk.load_mesh(extruded_mesh_name)
+
+        return cached_mesh(('initial_state', self.filename, self.comm.py2f()), load)
+
+    def load(self, fields):
+        """
+        Set `fields`, a dictionary of Functions on the mesh from `load_mesh`
+        by their names in the cache, to the cached state.
+        """
+        if self.filename not in _states:
+            mesh = self.load_mesh()
+            with CheckpointFile(self.filename, 'r', comm=self.comm) as chk:
+                _states[self.filename] = (mesh, {name: chk.load_function(mesh, name)
+                                                 for name in fields})
+        _, stored = _states[self.filename]
+        for name, field in fields.items():
+            field.assign(stored[name])
+
+    def save(self, mesh, fields):
+        """
+        Store `fields`, a dictionary of Functions on `mesh` by name, as the
+        state of this configuration.
+        """
+        _states[self.filename] = (mesh, {name: Function(field.function_space()).assign(field)
+                                         for name, field in fields.items()})
+        if not self.write:
+            return
+
+        # Write to a temporary file of this run's own, so that an interrupted
+        # write is not used, and concurrent runs writing the same state each
+        # replace the file with a complete one
+        if self.comm.rank == 0:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        tmp_filename = self.comm.bcast(f'{self.filename}.{uuid4().hex}.tmp'
+                                       if self.comm.rank == 0 else None, root=0)
+        with CheckpointFile(tmp_filename, 'w', comm=self.comm) as chk:
+            chk.save_mesh(mesh)
+            for name, field in fields.items():
+                chk.save_function(field, name=name)
+        self.comm.Barrier()
+        if self.comm.rank == 0:
+            os.replace(tmp_filename, self.filename)
+        self.comm.Barrier()
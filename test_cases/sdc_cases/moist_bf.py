@@ -0,0 +1,278 @@
+"""
+The moist rising bubble test from Bryan & Fritsch, 2002:
+``A Benchmark Simulation for Moist Nonhydrostatic Numerical Models'', GMD.
+
+The test simulates a rising thermal in a cloudy atmosphere, which is fueled by
+latent heating from condensation. This setup uses a vertical slice with the
+order 1 finite elements.
+"""
+from firedrake import (
+    SpatialCoordinate, conditional, cos, pi, sqrt, NonlinearVariationalProblem,
+    NonlinearVariationalSolver, TestFunction, dx, TrialFunction, Function,
+    as_vector, LinearVariationalProblem, LinearVariationalSolver, Constant,
+    COMM_WORLD, Ensemble
+)
+from gusto import (
+    Domain, CompressibleEulerEquations, IO, CompressibleParameters, DGUpwind,
+    WaterVapour, CloudWater, OutputParameters, Theta_e, SaturationAdjustment,
+    saturated_hydrostatic_balance, thermodynamics, Recoverer, Timestepper,
+    split_continuity_form, time_derivative, transport, source_label,
+    SUPGOptions, SplitDGUpwind, split_hv_advective_form
+)
+
+from .adaptive_dt import AdaptiveTimestepper
+from .common import (
+    nl_solver_parameters, vertical_slice_mesh, label_hv_imex, imex_sdc
+)
+from .initial_state import InitialStateCache
+from .registry import register_case
+from .solver_log import SolverLog
+
+moist_bf_defaults = {
+    'ncolumns': 100,
+    'nlayers': 100,
+    'dt': 1.0,
+    'tmax': 1000.0,
+    'dumpfreq': 250,
+    'dirname': 'moist_bryan_fritsch_imex_sdc',
+    'quad_type': 'GAUSS',
+    'M': 2,
+    'k': 3,
+    'qdelta_imp': 'LU',
+    'qdelta_exp': 'FE',
+    'parallel_nodes': False,
+    'solver_log': False,
+    'preconditioner': 'star',
+    'dt_tolerance': None,
+    'max_dt_halvings': 3,
+    'max_dt_doublings': 1,
+    'initial_state_cache': True,
+    'comm': COMM_WORLD
+}
+
+
+@register_case('moist_bf', moist_bf_defaults)
+def setup_moist_bf(
+        ncolumns, nlayers, dt, tmax, dumpfreq, dirname, quad_type, M, k,
+        qdelta_imp, qdelta_exp, parallel_nodes, dt_tolerance, max_dt_halvings,
+        max_dt_doublings, solver_log, preconditioner, initial_state_cache, comm
+):
+
+    # ------------------------------------------------------------------------ #
+    # Parameters for test case
+    # ------------------------------------------------------------------------ #
+    domain_width = 10000.     # domain width, in m
+    domain_height = 10000.    # domain height, in m
+    zc = 2000.                # vertical centre of bubble, in m
+    rc = 2000.                # radius of bubble, in m
+    Tdash = 2.0               # strength of temperature perturbation, in K
+    Tsurf = 320.0             # background theta_e value, in K
+    total_water = 0.02        # total moisture mixing ratio, in kg/kg
+
+    # ------------------------------------------------------------------------ #
+    # Our settings for this set up
+    # ------------------------------------------------------------------------ #
+    element_order = 1
+    u_eqn_type = 'vector_advection_form'
+
+    # ------------------------------------------------------------------------ #
+    # Set up model objects
+    # ------------------------------------------------------------------------ #
+
+    # With parallel nodes, each of M ensemble members solves at one node,
+    # with the mesh distributed over the processes of that member
+    if parallel_nodes:
+        ensemble = Ensemble(comm, comm.size // M)
+        comm = ensemble.comm
+    else:
+        ensemble = None
+
+    # The balanced initial state, if it has been cached before. All ensemble
+    # members find the same state, so only the first one writes it
+    state_cache = None
+    if initial_state_cache:
+        state_cache = InitialStateCache(
+            'moist_bf',
+            dict(ncolumns=ncolumns, nlayers=nlayers, element_order=element_order,
+                 domain_width=domain_width, domain_height=domain_height, zc=zc,
+                 rc=rc, Tdash=Tdash, Tsurf=Tsurf, total_water=total_water),
+            comm=comm, write=ensemble is None or ensemble.ensemble_comm.rank == 0)
+
+    # Domain
+    if state_cache is not None and state_cache.exists:
+        mesh = state_cache.load_mesh()
+    else:
+        mesh = vertical_slice_mesh(ncolumns, nlayers, domain_width,
+                                   domain_height, comm=comm)
+    domain = Domain(mesh, dt, 'CG', element_order)
+
+    # Equation
+    params = CompressibleParameters(mesh=mesh)
+    tracers = [WaterVapour(), CloudWater()]
+    eqns = CompressibleEulerEquations(
+        domain, params, active_tracers=tracers, u_transport_option=u_eqn_type
+    )
+
+    eqns = split_continuity_form(eqns)
+    eqns = split_hv_advective_form(eqns, "rho")
+    eqns = split_hv_advective_form(eqns, "theta")
+
+    opts = SUPGOptions(suboptions={"theta": [transport],
+                                   "water_vapour": [transport],
+                                   "cloud_water": [transport]})
+    # Check number of optimal cores
+    print("Opt Cores:", eqns.X.function_space().dim()/50000.)
+    # I/O -- all ensemble members hold the same solution, so only the first
+    # one writes it, and the others write nothing
+    first_member = ensemble is None or ensemble.ensemble_comm.rank == 0
+    output = OutputParameters(
+        dirname=dirname, dumpfreq=dumpfreq, dump_vtus=False,
+        dump_nc=first_member, dump_diagnostics=first_member
+    )
+    diagnostic_fields = [Theta_e(eqns)]
+    io = IO(domain, output, diagnostic_fields=diagnostic_fields)
+
+    transport_methods = [
+        DGUpwind(eqns, "u"), SplitDGUpwind(eqns, "rho"),
+        SplitDGUpwind(eqns, "theta", ibp=SUPGOptions.ibp),
+        DGUpwind(eqns, "water_vapour", ibp=SUPGOptions.ibp),
+        DGUpwind(eqns, "cloud_water", ibp=SUPGOptions.ibp)
+    ]
+
+    physics_schemes = [SaturationAdjustment(eqns)]
+    label_hv_imex(eqns, not_implicit=(time_derivative, transport, source_label))
+    log = None
+    if solver_log and first_member:
+        log = SolverLog(dirname, comm)
+    elif solver_log:
+        # The rows of the other nodes are written next to the first member's
+        # log at the end of the run, once its output directory exists
+        node = ensemble.ensemble_comm.rank + 1
+        log = SolverLog(dirname, comm, filename=f'solver_log_node{node}.csv',
+                        deferred=True)
+
+    def make_scheme():
+        return imex_sdc(domain, M, k, quad_type, qdelta_imp, qdelta_exp,
+                        final_update=True, initial_guess="copy", options=opts,
+                        nonlinear_solver_parameters=nl_solver_parameters(
+                            'moist_bf', preconditioner),
+                        ensemble=ensemble,
+                        estimate_error=dt_tolerance is not None,
+                        solver_log=log)
+
+    # Time stepper
+    if dt_tolerance is None:
+        stepper = Timestepper(eqns, make_scheme(), io, transport_methods,
+                              physics_parametrisations=physics_schemes)
+    else:
+        stepper = AdaptiveTimestepper(eqns, make_scheme, io, transport_methods,
+                                      dt_tolerance, dumpfreq*dt,
+                                      max_halvings=max_dt_halvings,
+                                      max_doublings=max_dt_doublings,
+                                      physics_parametrisations=physics_schemes)
+
+    # ------------------------------------------------------------------------ #
+    # Initial conditions
+    # ------------------------------------------------------------------------ #
+
+    u0 = stepper.fields("u")
+    rho0 = stepper.fields("rho")
+    theta0 = stepper.fields("theta")
+    water_v0 = stepper.fields("water_vapour")
+    water_c0 = stepper.fields("cloud_water")
+
+    # spaces
+    Vt = domain.spaces("theta")
+    Vr = domain.spaces("DG")
+
+    # mean fields
+    theta_b = Function(Vt)
+    rho_b = Function(Vr)
+    water_vb = Function(Vt)
+    water_cb = Function(Vt)
+    initial_state = {'u': u0, 'rho': rho0, 'theta': theta0,
+                     'water_vapour': water_v0, 'cloud_water': water_c0,
+                     'theta_b': theta_b, 'rho_b': rho_b, 'water_vb': water_vb,
+                     'water_cb': water_cb}
+
+    if state_cache is not None and state_cache.exists:
+        state_cache.load(initial_state)
+    else:
+        x, z = SpatialCoordinate(mesh)
+        quadrature_degree = (4, 4)
+        dxp = dx(degree=(quadrature_degree))
+
+        # Define constant theta_e and water_t
+        theta_e = Function(Vt).assign(Tsurf)
+        water_t = Function(Vt).assign(total_water)
+
+        # Calculate hydrostatic fields
+        saturated_hydrostatic_balance(eqns, stepper.fields, theta_e, water_t)
+
+        # make mean fields
+        theta_b.assign(theta0)
+        rho_b.assign(rho0)
+        water_vb.assign(water_v0)
+        water_cb.assign(water_t - water_vb)
+
+        # define perturbation
+        xc = domain_width / 2
+        r = sqrt((x - xc) ** 2 + (z - zc) ** 2)
+        theta_pert = Function(Vt).interpolate(
+            conditional(
+                r > rc,
+                0.0,
+                Tdash * (cos(pi * r / (2.0 * rc))) ** 2
+            )
+        )
+
+        # define initial theta
+        theta0.interpolate(theta_b * (theta_pert / 300.0 + 1.0))
+
+        # find perturbed rho
+        gamma = TestFunction(Vr)
+        rho_trial = TrialFunction(Vr)
+        a = gamma * rho_trial * dxp
+        L = gamma * (rho_b * theta_b / theta0) * dxp
+        rho_problem = LinearVariationalProblem(a, L, rho0)
+        rho_solver = LinearVariationalSolver(rho_problem)
+        rho_solver.solve()
+
+        # find perturbed water_v
+        w_v = Function(Vt)
+        phi = TestFunction(Vt)
+        rho_averaged = Function(Vt)
+        rho_recoverer = Recoverer(rho0, rho_averaged)
+        rho_recoverer.project()
+
+        exner = thermodynamics.exner_pressure(eqns.parameters, rho_averaged, theta0)
+        p = thermodynamics.p(eqns.parameters, exner)
+        T = thermodynamics.T(eqns.parameters, theta0, exner, r_v=w_v)
+        w_sat = thermodynamics.r_sat(eqns.parameters, T, p)
+
+        w_functional = (phi * w_v * dxp - phi * w_sat * dxp)
+        w_problem = NonlinearVariationalProblem(w_functional, w_v)
+        w_solver = NonlinearVariationalSolver(w_problem)
+        w_solver.solve()
+
+        water_v0.assign(w_v)
+        water_c0.assign(water_t - water_v0)
+
+        # wind initially zero
+        u0.project(as_vector(
+            [Constant(0.0, domain=mesh), Constant(0.0, domain=mesh)]
+        ))
+
+        if state_cache is not None:
+            state_cache.save(mesh, initial_state)
+
+    stepper.set_reference_profiles(
+        [
+            ('rho', rho_b),
+            ('theta', theta_b),
+            ('water_vapour', water_vb),
+            ('cloud_water', water_cb)
+        ]
+    )
+
+    return stepper
@@ -0,0 +1,133 @@
+"""
+Chunking and compression of the netCDF field output.
+
+gusto writes field_output.nc with the netCDF library's default chunking, so
+the plotting scripts, which read one time index of a field, read far more of
+the file than they use. A layout puts each time index of each field in a
+chunk of its own, which may be compressed with zlib, with or without the
+shuffle filter. It is applied to the output of a run when the run ends, and
+the file can still be appended to by a resumed run.
+
+A layout is a dictionary with the settings 'complevel', the zlib level from
+0 (chunking only) to 9, and 'shuffle'.
+"""
+import os
+import time
+
+from netCDF4 import Dataset
+
+time_dimension = 'time'
+
+
+def copy_group(source, target, complevel=0, shuffle=False):
+    """
+    Copy the dimensions, variables and attributes of netCDF group `source`,
+    and all of its subgroups, into `target`, with one chunk per time index
+    for each variable that depends on time.
+    """
+    target.setncatts({name: source.getncattr(name) for name in source.ncattrs()})
+    for name, dimension in source.dimensions.items():
+        target.createDimension(name, None if dimension.isunlimited() else len(dimension))
+
+    for name, variable in source.variables.items():
+        chunksizes = None
+        if time_dimension in variable.dimensions:
+            # The dimensions may belong to a parent group
+            chunksizes = [1 if dim.name == time_dimension else len(dim)
+                          for dim in variable.get_dims()]
+        attributes = {attr: variable.getncattr(attr) for attr in variable.ncattrs()}
+        new = target.createVariable(
+            name, variable.datatype, variable.dimensions, zlib=complevel > 0,
+            complevel=max(complevel, 1), shuffle=shuffle and complevel > 0,
+            chunksizes=chunksizes, fill_value=attributes.pop('_FillValue', None))
+        new.setncatts(attributes)
+
+        # Copy a time index at a time, to bound the memory used
+        if time_dimension in variable.dimensions and variable.size > 0:
+            axis = variable.dimensions.index(time_dimension)
+            for index in range(variable.shape[axis]):
+                where = tuple(index if i == axis else slice(None)
+                              for i in range(variable.ndim))
+                new[where] = variable[where]
+        else:
+            new[...] = variable[...]
+
+    for name, group in source.groups.items():
+        copy_group(group, target.createGroup(name), complevel, shuffle)
+
+
+def write_layout(source, target, complevel=0, shuffle=False):
+    """Write a copy of the netCDF file `source` to `target` with a layout."""
+    with Dataset(source, 'r') as old, Dataset(target, 'w') as new:
+        copy_group(old, new, complevel, shuffle)
+
+
+def apply_layout(filename, layout, comm):
+    """
+    Rewrite the netCDF file `filename` with `layout`, from rank 0 of `comm`.
+    A file that does not exist, as when a run dumps no netCDF, is ignored.
+    """
+    if comm.rank == 0 and os.path.exists(filename):
+        tmp_filename = f'{filename}.tmp'
+        write_layout(filename, tmp_filename, **layout)
+        os.replace(tmp_filename, filename)
+    comm.Barrier()
+
+
+def read_time_slices(filename, time_idx=-1):
+    """
+    Read time index `time_idx` of every variable in the netCDF file
+    `filename` that depends on time, as the plotting scripts do.
+
+    Returns:
+        float: the time taken, in seconds.
+    """
+    def read(group):
+        for variable in group.variables.values():
+            if time_dimension in variable.dimensions and variable.size > 0:
+                axis = variable.dimensions.index(time_dimension)
+                variable[tuple(time_idx if i == axis else slice(None)
+                               for i in range(variable.ndim))]
+        for subgroup in group.groups.values():
+            read(subgroup)
+
+    start = time.perf_counter()
+    with Dataset(filename, 'r') as data:
+        read(data)
+    return time.perf_counter() - start
+
+
+def benchmark_layouts(filename, layouts, repeats=3):
+    """
+    Compare the cost of writing the netCDF file `filename` with each of
+    `layouts`, and of reading the last time index of its fields back.
+
+    Returns:
+        list: a dictionary for each layout, and for the file as it is, of
+            the write time, file size and best read time of `repeats`.
+    """
+    results = [{'layout': 'as written', 'write_time': None,
+                'size': os.path.getsize(filename),
+                'read_time': min(read_time_slices(filename) for _ in range(repeats))}]
+    for layout in layouts:
+        target = f'{filename}.benchmark'
+        start = time.perf_counter()
+        write_layout(filename, target, **layout)
+        write_time = time.perf_counter() - start
+        results.append({'layout': layout, 'write_time': write_time,
+                        'size': os.path.getsize(target),
+                        'read_time': min(read_time_slices(target) for _ in range(repeats))})
+        os.remove(target)
+    return results
+
+
+def format_result(result):
+    """One line summary of a layout benchmark result."""
+    layout = result['layout']
+    label = layout if isinstance(layout, str) else ' '.join(
+        f'{key}={value}' for key, value in sorted(layout.items()))
+    write_time = result['write_time']
+    write = '-' if write_time is None else f'{write_time:.3f} s'
+    return (f"{label:30s} write {write:>10s}  "
+            f"size {result['size']/2**20:9.2f} MiB  read {result['read_time']:.4f} s")
+
@@ -0,0 +1,194 @@
+"""
+Benchmark of the representations of the Jacobian of the SDC node solves.
+
+Each benchmarked case is run for a few time steps at several mesh sizes with
+each of the operators of `nl_solver_parameters`: matrix-free GMRES with an
+assembled patch preconditioner ("hybrid", the default), fully assembled aij
+or baij matrices, and matrix-free GMRES with a diagonal preconditioner.
+
+The times come from the run's solver log. As the Jacobians and patch
+factorisations are built in the first step and then kept, the time per
+Krylov iteration is measured over the later steps, and the setup time is
+what the first step's solves took beyond its iterations at that rate.
+The peak memory is the resident set high-water mark of each process, which
+is reset before each run where Linux allows it.
+"""
+import json
+import os
+import resource
+import shutil
+from time import perf_counter
+
+from firedrake import COMM_WORLD
+from mpi4py import MPI
+from petsc4py import PETSc
+
+from .common import operators
+from .gravity_wave import convergence_config
+from .registry import run_case
+from .solver_log import log_filename
+
+# The case, shortened settings and mesh sizes of each benchmark
+benchmark_cases = {
+    'gravity_wave_o1': (
+        'gravity_wave', {'tmax': 240., 'dumpfreq': 20},
+        [{'ncolumns': 75, 'nlayers': 5},
+         {'ncolumns': 150, 'nlayers': 10},
+         {'ncolumns': 300, 'nlayers': 20}]
+    ),
+    'gravity_wave_o5': (
+        'gravity_wave', convergence_config(5, 30., 1.875, tmax=16*1.875),
+        [{'ncolumns': 15}, {'ncolumns': 30}, {'ncolumns': 60}]
+    ),
+    'baroclinic_channel': (
+        'baroclinic_channel', {'tmax': 4*1800., 'dumpfreq': 4},
+        [{'nx': 40, 'ny': 6, 'nlayers': 10},
+         {'nx': 80, 'ny': 12, 'nlayers': 15},
+         {'nx': 160, 'ny': 24, 'nlayers': 20}]
+    ),
+}
+
+benchmark_dirname = 'operator_benchmark'
+
+
+def reset_peak_memory():
+    """Reset the resident set high-water mark of this process, if possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_memory():
+    """The resident set high-water mark of this process, in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    # Without /proc, this is the peak over the life of the process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def read_solve_times(dirname):
+    """The wall time and KSP iterations of the node solves of each step."""
+    steps = {}
+    with open(os.path.join('results', dirname, log_filename)) as f:
+        header = f.readline().strip().split(',')
+        for line in f:
+            row = dict(zip(header, line.strip().split(',')))
+            if row['stage'] == 'solve':
+                time, ksp_its = steps.get(int(row['step']), (0., 0))
+                steps[int(row['step'])] = (time + float(row['time']),
+                                           ksp_its + int(row['ksp_its']))
+    return [steps[step] for step in sorted(steps)]
+
+
+def solve_statistics(steps):
+    """
+    The total solve time, KSP iterations, time per iteration and setup time
+    from the solve times and iterations of each step.
+    """
+    solve_time = sum(time for time, _ in steps)
+    ksp_its = sum(its for _, its in steps)
+    later_time = sum(time for time, _ in steps[1:])
+    later_its = sum(its for _, its in steps[1:])
+    if later_its > 0:
+        iteration_time = later_time/later_its
+        setup_time = steps[0][0] - steps[0][1]*iteration_time
+    else:
+        iteration_time = solve_time/ksp_its if ksp_its > 0 else None
+        setup_time = None
+    return {'solve_time': solve_time, 'ksp_its': ksp_its,
+            'iteration_time': iteration_time, 'setup_time': setup_time}
+
+
+def run_benchmark(label, operator, size, comm=COMM_WORLD):
+    """
+    Run benchmark `label` at mesh `size` with the Jacobian as `operator`.
+
+    Returns:
+        dict: the wall time of the run, its solve statistics and the peak
+            memory of its processes, or the error if it failed.
+    """
+    name, settings, _ = benchmark_cases[label]
+    size_name = '_'.join(f'{key}_{value}' for key, value in size.items())
+    dirname = os.path.join(benchmark_dirname, label, operator, size_name)
+    if comm.rank == 0:
+        shutil.rmtree(os.path.join('results', dirname), ignore_errors=True)
+    comm.Barrier()
+
+    reset_peak_memory()
+    start = perf_counter()
+    try:
+        run_case(name, **dict(settings, **size, dirname=dirname,
+                              operator=operator, solver_log=True, comm=comm))
+        error = None
+    except (PETSc.Error, NotImplementedError) as e:
+        # Not every operator can be assembled for every mixed function space,
+        # which PETSc or firedrake report from the assembly on every process
+        error = f'{type(e).__name__}: {e}'
+    elapsed = comm.allreduce(perf_counter() - start, op=MPI.MAX)
+    errors = [e for e in comm.allgather(error) if e is not None]
+
+    result = {'label': label, 'operator': operator, 'size': size,
+              'processes': comm.size}
+    if errors:
+        result['error'] = errors[0]
+        return result
+
+    memory = peak_memory()
+    result.update(
+        time=elapsed,
+        peak_memory_max=comm.allreduce(memory, op=MPI.MAX),
+        peak_memory_total=comm.allreduce(memory, op=MPI.SUM),
+        **comm.bcast(solve_statistics(read_solve_times(dirname))
+                     if comm.rank == 0 else None, root=0))
+    return result
+
+
+def benchmark_case(label, operators=operators, comm=COMM_WORLD):
+    """
+    Run benchmark `label` at each of its mesh sizes with each operator.
+
+    Returns:
+        list: the result of each run.
+    """
+    _, _, sizes = benchmark_cases[label]
+    results = []
+    for size in sizes:
+        for i, operator in enumerate(operators):
+            # Compile the forms at this size, so the first operator's times
+            # are comparable with the rest
+            if i == 0:
+                run_benchmark(label, operator, size, comm)
+            results.append(run_benchmark(label, operator, size, comm))
+    return results
+
+
+def format_result(result):
+    """A one-line summary of a benchmark run."""
+    prefix = f"{result['label']} {result['size']} {result['operator']}:"
+    if 'error' in result:
+        return f"{prefix} failed, {result['error']}"
+
+    def seconds(value):
+        return '-' if value is None else f'{value:.3g}s'
+
+    return (f"{prefix} {seconds(result['time'])} in total, "
+            + f"{seconds(result['solve_time'])} solving, "
+            + f"{seconds(result['setup_time'])} setup, "
+            + f"{seconds(result['iteration_time'])} per iteration "
+            + f"({result['ksp_its']} iterations), "
+            + f"peak memory {result['peak_memory_max']:.0f}MB per process")
+
+
+def write_results(results, filename, comm=COMM_WORLD):
+    """Write the benchmark results to `filename`, as JSON."""
+    if comm.rank == 0:
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2)
+    comm.Barrier()
@@ -0,0 +1,73 @@
+"""
+Field output written collectively by all of the processes of a run.
+
+gusto gathers each output field to rank 0, which writes it to
+field_output.nc alone, so at large process counts the writing is limited to
+one process and that process holds every field in full. Here gusto still
+creates the file with its coordinates, and decides when to dump, but each
+dump, including the one at the initial time, is written with parallel
+netCDF4/HDF5: each process writes the values of the degrees of freedom it
+owns straight into its own part of each field. The parts are in order of
+rank, the order in which gusto gathers them, so the file is the same as
+gusto's and is read by tomplot as before.
+
+This needs netCDF4 built with parallel HDF5 support.
+"""
+import os
+
+import netCDF4
+from gusto import IO
+
+nc_filename = 'field_output.nc'
+
+
+class ParallelNetCDFIO(IO):
+    """
+    gusto's IO, with the field output of each dump written collectively by
+    all processes, instead of gathered to rank 0.
+    """
+
+    def setup_dump(self, state_fields, t, pick_up=False):
+        if self.output.dump_nc and not netCDF4.__has_parallel4_support__:
+            raise RuntimeError('Parallel field output needs netCDF4 built '
+                               'with parallel HDF5 support')
+        # Set before gusto creates the file and makes the initial dump
+        self.nc_offsets = {}
+        super().setup_dump(state_fields, t, pick_up)
+
+    def offset(self, field, ndofs):
+        """
+        The start and end in the file's array of `field` of the degrees of
+        freedom owned by this process, given the array length `ndofs`.
+        """
+        name = field.name()
+        if name not in self.nc_offsets:
+            comm = self.domain.mesh.comm
+            nlocal = len(field.dat.data_ro)
+            start = comm.exscan(nlocal) or 0
+            if comm.allreduce(nlocal) != ndofs:
+                raise ValueError(f'Field {name} has a different number of '
+                                 f'degrees of freedom to its output')
+            self.nc_offsets[name] = (start, start + nlocal)
+        return self.nc_offsets[name]
+
+    def write_nc_dump(self, t):
+        """
+        Append the fields at time `t` to the file, in place of gusto's
+        gathered write, when gusto's dump counter says that one is due.
+        """
+        comm = self.domain.mesh.comm
+        # The file is created by rank 0 alone
+        comm.Barrier()
+        fields = {field.name(): field for field in self.to_dump}
+        with netCDF4.Dataset(os.path.join(self.dumpdir, nc_filename), 'a',
+                             parallel=True, comm=comm) as nc:
+            index = len(nc.dimensions['time'])
+            nc['time'].set_collective(True)
+            nc['time'][index] = t
+            for name, group in nc.groups.items():
+                field = fields[name]
+                values = group['field_values']
+                values.set_collective(True)
+                start, end = self.offset(field, values.shape[0])
+                values[start:end, index] = field.dat.data_ro
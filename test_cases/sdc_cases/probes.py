@@ -0,0 +1,123 @@
+"""
+Output of fields at a fixed set of points, at every step of a run.
+
+The points are located in the mesh once, by building a vertex-only mesh of
+them, which holds the cell and reference coordinates of each point on the
+process owning it. At each step the fields are interpolated onto that mesh,
+which only evaluates them in those cells, and the values are brought back
+to rank 0 in the order the points were given. Rank 0 appends them to
+probes.nc in the run's output directory, which has an unlimited time
+dimension. A resumed run continues from the last record at or before the
+time of its checkpoint, overwriting those made after it by the interrupted
+run.
+"""
+import os
+
+from firedrake import (
+    VertexOnlyMesh, FunctionSpace, VectorFunctionSpace, Function
+)
+from netCDF4 import Dataset
+
+probes_filename = 'probes.nc'
+
+
+class PointProbes(object):
+    """
+    Values of fields at fixed points.
+
+    Args:
+        mesh (:class:`Mesh`): the mesh of the fields.
+        points (list): the coordinates of the points.
+        names (list): the names of the fields to evaluate, which may be
+            prognostic or diagnostic fields.
+        dirname (str): the output directory of the run, relative to results/.
+    """
+
+    def __init__(self, mesh, points, names, dirname):
+        self.mesh = mesh
+        self.comm = mesh.comm
+        self.points = points
+        self.names = names
+        self.filename = os.path.join('results', dirname, probes_filename)
+
+    def setup(self, state_fields, t, pick_up=False):
+        """
+        Locate the points and create the output file, once the fields of
+        `state_fields`, including the diagnostics, and the output directory
+        have been set up. When picking up at time `t`, the existing file is
+        continued from that time instead.
+        """
+        self.fields = [state_fields(name) for name in self.names]
+
+        # The lookup of the points, made once
+        vom = VertexOnlyMesh(self.mesh, self.points, redundant=True)
+        self.values = []
+        self.ordered = []
+        for field in self.fields:
+            space = FunctionSpace if len(field.ufl_shape) == 0 else VectorFunctionSpace
+            self.values.append(Function(space(vom, "DG", 0)))
+            # The values on rank 0, in the order of the points
+            self.ordered.append(Function(space(vom.input_ordering, "DG", 0)))
+
+        # The index of the next record
+        self.index = 0
+        if self.comm.rank != 0:
+            return
+        if pick_up and os.path.exists(self.filename):
+            with Dataset(self.filename, 'r') as nc:
+                times = nc['time'][:]
+            self.index = int((times <= t + 1e-9*max(abs(t), 1.)).sum())
+            return
+        with Dataset(self.filename, 'w') as nc:
+            nc.createDimension('time', None)
+            nc.createDimension('point', len(self.points))
+            nc.createDimension('coord', len(self.points[0]))
+            nc.createVariable('time', float, ('time',))
+            nc.createVariable('points', float, ('point', 'coord'))[:] = self.points
+            for field in self.fields:
+                dims = ('time', 'point')
+                if len(field.ufl_shape) > 0:
+                    component = f'{field.name()}_component'
+                    nc.createDimension(component, field.ufl_shape[0])
+                    dims += (component,)
+                nc.createVariable(field.name(), float, dims)
+
+    def record(self, t):
+        """Append the values of the fields at time `t`."""
+        for field, values, ordered in zip(self.fields, self.values, self.ordered):
+            values.interpolate(field)
+            ordered.interpolate(values)
+        if self.comm.rank != 0:
+            return
+        with Dataset(self.filename, 'a') as nc:
+            nc['time'][self.index] = t
+            for field, ordered in zip(self.fields, self.ordered):
+                nc[field.name()][self.index] = ordered.dat.data_ro
+        self.index += 1
+
+
+class ProbeOutput(object):
+    """
+    A case's IO object, which also records point probes at each step.
+
+    Args:
+        io (:class:`IO`): the IO object.
+        probes (:class:`PointProbes`): the probes to record.
+    """
+
+    def __init__(self, io, probes):
+        self.io = io
+        self.probes = probes
+
+    def __getattr__(self, name):
+        return getattr(self.io, name)
+
+    def setup_dump(self, state_fields, t, pick_up=False):
+        self.io.setup_dump(state_fields, t, pick_up)
+        self.probes.setup(state_fields, t, pick_up)
+        if not pick_up:
+            self.probes.record(t)
+
+    def dump(self, state_fields, t, step, initial_steps=None):
+        self.io.dump(state_fields, t, step, initial_steps)
+        self.probes.record(t)
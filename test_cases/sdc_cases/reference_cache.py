@@ -0,0 +1,119 @@
+"""
+Content-addressed cache of reference ("true") solutions.
+
+A reference run is stored under results/reference_cache/<key>, where the key
+is a hash of the case name, all of its settings that change the solution
+(mesh, element order, scheme, dt, tmax, ...), defaults included, and the
+shared solver options, so that changing a default gives a new entry. The
+hash also includes `cache_version`, which is increased when the settings are
+changed in a way that should not invalidate the references already stored,
+such as adding a setting. Once a run has completed, a
+metadata file marks the entry as valid and the run's usual output directory
+is linked to it, so the plotting scripts find it where they always have.
+Later requests for the same reference reuse the entry instead of rerunning.
+"""
+from hashlib import sha256
+import json
+import os
+
+from firedrake import COMM_WORLD
+
+from .common import nl_solver_parameters, linear_solver_parameters
+from .registry import case_config, run_case
+
+results_dir = 'results'
+cache_dirname = 'reference_cache'
+metadata_file = 'reference.json'
+
+# Version of the keys, see above
+cache_version = 1
+
+# Settings that do not change the solution
+_unhashed_settings = ['dirname', 'dumpfreq', 'chkptfreq', 'resume', 'solver_log',
+                      'initial_state_cache', 'diagnostics', 'nc_layout', 'nc_backend',
+                      'probe_fields', 'comm']
+
+
+def reference_key(name, **overrides):
+    """Return the hash identifying the reference run of case `name`."""
+    config = {key: value for key, value in case_config(name, **overrides).items()
+              if key not in _unhashed_settings}
+    content = {
+        'version': cache_version,
+        'case': name,
+        'config': config,
+        'nl_solver_parameters': nl_solver_parameters(name),
+        'linear_solver_parameters': linear_solver_parameters()
+    }
+    return sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def reference_dirname(name, **overrides):
+    """The output directory, relative to results/, of a cached reference."""
+    return os.path.join(cache_dirname, reference_key(name, **overrides))
+
+
+def has_reference(name, **overrides):
+    """Whether a completed reference run of case `name` is in the cache."""
+    return os.path.exists(os.path.join(
+        results_dir, reference_dirname(name, **overrides), metadata_file))
+
+
+def store_reference(name, **overrides):
+    """
+    Mark the cache entry of a reference run as complete, and link the run's
+    usual output directory (the 'dirname' setting) to it.
+    """
+    comm = overrides.get('comm', COMM_WORLD)
+    if comm.rank == 0:
+        cached_dirname = reference_dirname(name, **overrides)
+        config = case_config(name, **overrides)
+        metadata_path = os.path.join(results_dir, cached_dirname, metadata_file)
+        if not os.path.exists(metadata_path):
+            metadata = {
+                'case': name,
+                'config': {k: v for k, v in config.items() if k != 'comm'},
+                'nl_solver_parameters': nl_solver_parameters(name),
+                'linear_solver_parameters': linear_solver_parameters()
+            }
+            with open(metadata_path, 'w') as f:
+                json.dump(metadata, f, indent=2, default=str)
+
+        link = os.path.join(results_dir, config['dirname'])
+        if os.path.islink(link):
+            os.remove(link)
+        if os.path.exists(link):
+            print(f"Not linking {link} to {cached_dirname}, as it already exists")
+        else:
+            os.symlink(cached_dirname, link)
+    comm.Barrier()
+
+
+def cached_reference_overrides(name, **overrides):
+    """
+    Return the settings that make a reference run write into the cache, for
+    use when the run is scheduled with others. `store_reference` must be
+    called once it has completed.
+    """
+    return dict(overrides, dirname=reference_dirname(name, **overrides))
+
+
+def run_reference(name, **overrides):
+    """
+    Make sure that the reference run of case `name` is in the cache, running
+    it only if it is not.
+
+    Args:
+        name (str): the case name.
+        **overrides: the settings of the run. 'dirname' should be the usual
+            output directory of the reference, which is linked to the cache.
+
+    Returns:
+        str: the path of the cached output directory.
+    """
+    if has_reference(name, **overrides):
+        print(f"Using cached reference {reference_dirname(name, **overrides)}")
+    else:
+        run_case(name, **cached_reference_overrides(name, **overrides))
+    store_reference(name, **overrides)
+    return os.path.join(results_dir, reference_dirname(name, **overrides))
@@ -0,0 +1,129 @@
+"""
+Registry of the test cases and the functions that run them.
+
+Each case registers a setup function, which builds and initialises a gusto
+time stepper, together with a dictionary of default settings. Cases are run
+by name with any of those settings overridden, and several runs can be made
+one after another in the same process.
+"""
+import os
+import time
+
+from .nc_layout import apply_layout
+
+CASES = {}
+COSTS = {}
+
+
+def register_case(name, defaults, cost=None):
+    """
+    Decorator registering `setup` as the test case `name`.
+
+    Args:
+        name (str): the name of the case, used by `run_case`.
+        defaults (dict): the default settings of the case, all of which are
+            passed to the setup function. These must include 'tmax'.
+        cost (func, optional): function of the settings returning an
+            estimate of the relative cost of a run, used to share out
+            processes between runs. Defaults to None, in which case all runs
+            of the case are assumed to cost the same.
+    """
+    def decorator(setup):
+        CASES[name] = (setup, defaults)
+        if cost is not None:
+            COSTS[name] = cost
+        return setup
+    return decorator
+
+
+def case_config(name, **overrides):
+    """Return the full settings for case `name`, with `overrides` applied."""
+    if name not in CASES:
+        raise KeyError(f'Unknown test case {name}, options are {sorted(CASES)}')
+    _, defaults = CASES[name]
+    unknown = set(overrides) - set(defaults)
+    if unknown:
+        raise ValueError(f'Unknown settings {sorted(unknown)} for test case {name}')
+    config = dict(defaults)
+    config.update(overrides)
+    return config
+
+
+def case_cost(name, **overrides):
+    """Return the estimated relative cost of running case `name`."""
+    config = case_config(name, **overrides)
+    if name not in COSTS:
+        return 1.0
+    return float(COSTS[name](**config))
+
+
+def setup_case(name, **overrides):
+    """
+    Build the time stepper for case `name`.
+
+    Returns:
+        tuple: the stepper and the end time of the run.
+    """
+    config = case_config(name, **overrides)
+    setup, _ = CASES[name]
+    return setup(**config), config['tmax']
+
+
+def finish_output(config):
+    """
+    Give the field output of a run with settings `config` the layout of its
+    'nc_layout' setting, if it has one.
+    """
+    layout = config.get('nc_layout')
+    if layout is not None:
+        apply_layout(os.path.join('results', config['dirname'], 'field_output.nc'),
+                     layout, config['comm'])
+
+
+def close_solver_log(stepper):
+    """Close the solver log of `stepper`'s scheme, if it has one."""
+    # The schemes of the levels of adaptive time stepping share one log
+    solver_log = getattr(stepper.scheme, 'solver_log', None)
+    if solver_log is not None:
+        solver_log.close()
+
+
+def run_case(name, **overrides):
+    """
+    Set up and run case `name`, returning the stepper.
+
+    Cases with a 'resume' setting can be continued from their latest
+    checkpoint: the fields, reference profiles, time and step counter are
+    then picked up from it and the field output is appended to. SDC carries
+    no state from one step to the next, so nothing more is needed. Cases
+    with an 'nc_layout' setting have it applied to their field output at
+    the end of the run.
+    """
+    stepper, tmax = setup_case(name, **overrides)
+    config = case_config(name, **overrides)
+    pick_up = config.get('resume', False)
+
+    start_time = time.time()
+    stepper.run(t=0, tmax=tmax, pick_up=pick_up)
+    end_time = time.time()
+    print("Time taken:", end_time - start_time)
+    close_solver_log(stepper)
+    finish_output(config)
+
+    # Schemes that choose their number of sweeps report how many they made
+    sweep_counts = getattr(stepper.scheme, 'sweep_counts', None)
+    if sweep_counts:
+        print("Mean SDC sweeps per step:", sum(sweep_counts)/len(sweep_counts))
+
+    return stepper
+
+
+def run(runs):
+    """
+    Run a sequence of cases in this process.
+
+    Args:
+        runs (iter): (name, overrides) pairs, run in order.
+    """
+    for name, overrides in runs:
+        run_case(name, **overrides)
@@ -0,0 +1,100 @@
+"""
+Scheduling of a matrix of independent runs (e.g. every dt with every SDC
+scheme) onto a fixed number of workers.
+
+Jobs are ordered longest first by their estimated cost and each is given to
+the least loaded worker. The workers are either processes of a local pool,
+or equally sized ensemble sub-communicators of COMM_WORLD when running under
+MPI.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+import time
+
+from firedrake import COMM_WORLD, Ensemble
+
+from .registry import case_cost, run_case
+
+
+def lpt_schedule(costs, nworkers):
+    """
+    Assign jobs to workers with the longest-processing-time-first rule.
+
+    Args:
+        costs (list): the estimated cost of each job.
+        nworkers (int): the number of workers.
+
+    Returns:
+        list: for each worker, the indices of its jobs in the order to run
+            them.
+    """
+    loads = [0.0]*nworkers
+    assignment = [[] for _ in range(nworkers)]
+    for job in sorted(range(len(costs)), key=lambda j: costs[j], reverse=True):
+        worker = min(range(nworkers), key=lambda w: loads[w])
+        assignment[worker].append(job)
+        loads[worker] += costs[job]
+    return assignment
+
+
+def _run_job(name, overrides):
+    """Run a single job in a pool worker, returning its wall time."""
+    start_time = time.time()
+    run_case(name, **overrides)
+    return time.time() - start_time
+
+
+def pool_run(runs, nworkers):
+    """
+    Run the jobs on a pool of `nworkers` local processes.
+
+    The jobs are submitted longest first, so that each free worker picks up
+    the longest remaining job. The workers are started with 'spawn', as
+    forking a process that has initialised MPI is not safe, and each worker
+    is reused for several jobs so that it only pays the import cost once.
+    This must be run by a single process, not under `mpiexec -n N` with
+    N > 1, as each process would run every job.
+
+    Args:
+        runs (list): (name, overrides) pairs, one per job.
+        nworkers (int): the number of processes in the pool.
+    """
+    if COMM_WORLD.size != 1:
+        raise ValueError(f'A local pool must be run from one process, not '
+                         f'{COMM_WORLD.size}; use ensemble_pool_run instead')
+
+    costs = [case_cost(name, **overrides) for name, overrides in runs]
+    order = sorted(range(len(runs)), key=lambda j: costs[j], reverse=True)
+
+    with ProcessPoolExecutor(max_workers=nworkers,
+                             mp_context=get_context('spawn')) as pool:
+        futures = {pool.submit(_run_job, *runs[job]): job for job in order}
+        for future in as_completed(futures):
+            name, overrides = runs[futures[future]]
+            print(f"Finished {name} {overrides} in {future.result()} s")
+
+
+def ensemble_pool_run(runs, nworkers, comm=COMM_WORLD):
+    """
+    Run the jobs on `nworkers` ensemble members, each of which runs its share
+    of the jobs one after another on its sub-communicator.
+
+    Args:
+        runs (list): (name, overrides) pairs, one per job.
+        nworkers (int): the number of ensemble members. This must divide the
+            size of `comm`.
+        comm (:class:`MPI.Comm`, optional): the communicator to split.
+            Defaults to COMM_WORLD.
+    """
+    if comm.size % nworkers != 0:
+        raise ValueError(f'{nworkers} workers do not divide {comm.size} processes')
+
+    ensemble = Ensemble(comm, comm.size // nworkers)
+    costs = [case_cost(name, **overrides) for name, overrides in runs]
+    assignment = lpt_schedule(costs, nworkers)
+
+    for job in assignment[ensemble.ensemble_comm.rank]:
+        name, overrides = runs[job]
+        run_case(name, comm=ensemble.comm, **overrides)
+
+    comm.Barrier()
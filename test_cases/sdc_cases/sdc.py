@@ -0,0 +1,549 @@
+"""
+Extensions of gusto's SDC time discretisation.
+
+`SweepSDC` follows gusto's `SDC.apply`, but splits a time step into its
+predictor, the correction sweeps (each a loop of node solves) and the final
+update, so that subclasses can change how the sweeps are executed without
+copying the whole loop. Plain gusto `SDC` is still used for runs that do not
+need any of these extensions.
+
+With `hybridised` set, the node problems are not solved by Newton's method.
+Instead, each node solve makes a single correction from the linear system
+of the equations about their reference profiles, which gusto's hybridised
+`CompressibleSolver` reduces by static condensation to a system for the
+trace of the Exner pressure. The error of the linearisation is then
+corrected by the SDC sweeps, as is that of the Qdelta approximation.
+"""
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+from firedrake import (
+    Function, NonlinearVariationalProblem, NonlinearVariationalSolver,
+    LinearVariationalProblem, LinearVariationalSolver, TrialFunction, inner,
+    dx, norm
+)
+from gusto import SDC, CompressibleSolver, logger
+from qmat import genQDeltaCoeffs
+
+
+def relative_norm(diff, U):
+    """
+    The largest L2 norm of the fields of `diff`, each relative to the same
+    field of `U`, as the scales of the prognostic fields differ.
+    """
+    result = 0.
+    for d, u in zip(diff.subfunctions, U.subfunctions):
+        u_norm = norm(u)
+        if u_norm > 0:
+            result = max(result, norm(d)/u_norm)
+    return result
+
+
+class SweepSDC(SDC):
+    """
+    SDC with the time step split into overridable stages.
+
+    The arguments are the same as for gusto's `SDC`. If `estimate_error` is
+    set, each sweep stores in `error` the relative change that it makes to
+    the value at the final node, which after the last sweep is an estimate
+    of the error of the step. If a `solver_log` (a :class:`SolverLog`) is
+    set, the time and solver iterations of each stage of each step are
+    recorded in it. If `hybridised` is set, the node solves are linearised
+    about the reference profiles of the equation, which must be set before
+    the first step.
+
+    If `inexact` is set to a factor eta, the Newton solves of each sweep but
+    the last are only made to a relative tolerance of eta times the relative
+    collocation residual at the start of the sweep, between the solvers' own
+    tolerances and `max_loosening` times them. The early sweeps, whose node
+    values are corrected by the later ones, then take fewer iterations.
+
+    The node solvers keep their Jacobians and preconditioners once built. If
+    `refresh_growth` is set, a node solver's are rebuilt in its next solve
+    once its Krylov iterations per Newton iteration exceed `refresh_growth`
+    times those of its first solve after they were last built.
+
+    Besides gusto's "copy" and "base", `initial_guess` can be "extrapolate",
+    which predicts the node values of a step by evaluating the collocation
+    polynomial of the previous step (through its start and node values) at
+    the new nodes. The first step, and any step not continuing the previous
+    one, copies the start value instead.
+
+    The node solvers are cached by the Qdelta coefficients of their node.
+    With the shared solver options, the Jacobian and preconditioner of each
+    solver (including the assembled patch factorisations) are built once and
+    then kept, so each set of coefficients has its own factorisation, which
+    is reused in every step in which the coefficients recur. For LU Qdelta
+    that is just gusto's solver for each node; for MIN-SR-FLEX, whose
+    coefficients change with the sweep, it is one solver per node and sweep.
+    """
+
+    # Largest factor by which inexact sweeps loosen the solver tolerances
+    max_loosening = 100.
+
+    def __init__(self, base_scheme, domain, M, maxk, quad_type, node_type,
+                 qdelta_imp, qdelta_exp, **kwargs):
+        super().__init__(base_scheme, domain, M, maxk, quad_type, node_type,
+                         qdelta_imp, qdelta_exp, **kwargs)
+        self.qdelta_imp_type = qdelta_imp
+        # Number of sweeps made in the most recent time step
+        self.sweeps = 0
+        self.estimate_error = False
+        self.error = None
+        self.solver_log = None
+        self.hybridised = False
+        self.inexact = None
+        self.refresh_growth = None
+        # Krylov iterations per Newton iteration of each node solver, in its
+        # first solve after its preconditioner was built
+        self.baseline_iterations = {}
+        self.refreshes = 0
+        # Factor by which the node solves of the current sweep are loosened
+        self.loosening = 1.
+        # The most recent collocation residual, if computed
+        self.residual = None
+        # Whether fUnodes and quad hold F and its quadrature for the current
+        # node values
+        self.current_rhs = False
+        # Number of steps taken, including any that are rejected
+        self.steps_taken = 0
+
+    def setup(self, equation, apply_bcs=True, *active_labels):
+        super().setup(equation, apply_bcs, *active_labels)
+        self.U_diff = Function(self.W)
+        # gusto's node solvers are for the initial coefficients
+        self.solver_cache = {self.solver_key(m): self.solvers[m-1]
+                             for m in range(1, self.M+1)}
+        # The SNES and KSP tolerances that each node solver was built with
+        self.base_tolerances = {}
+        # Residual and hybridised solvers of the linearised node solves
+        self.linear_cache = {}
+        self.node_residual = Function(self.W)
+        self.dU = Function(self.W)
+        if self.initial_guess == "extrapolate":
+            # The previous step's start and node values
+            self.Uprev = [Function(self.W) for _ in range(self.M+1)]
+            self.weights_extrapolate = self.extrapolation_weights()
+            self.has_history = False
+
+    def extrapolation_weights(self):
+        """
+        The weights of the previous step's values, at its start and at each
+        node, in the values of its collocation polynomial at the nodes of the
+        next step. Row m-1 gives the values at node m.
+        """
+        dt = float(self.domain.dt)
+        # Nodes as fractions of the step, leaving out any node at the start
+        # of the step (as with Lobatto nodes), which is already a point
+        points = [(0, 0.)] + [(j, tau/dt) for j, tau in enumerate(self.nodes, 1)
+                              if tau/dt > 1e-12]
+        weights = np.zeros((self.M, self.M+1))
+        for m, tau in enumerate(self.nodes):
+            x = 1 + tau/dt
+            for j, xj in points:
+                weights[m, j] = np.prod([(x - xi)/(xj - xi)
+                                         for i, xi in points if i != j])
+        return weights
+
+    def reset_history(self):
+        """Forget the previous step, e.g. when the step does not continue it."""
+        if self.initial_guess == "extrapolate":
+            self.has_history = False
+
+    def solver_key(self, m):
+        """The Qdelta coefficients that determine the solver for node m."""
+        return (m, tuple(np.round(self.Qdelta_imp[m-1], 12)),
+                tuple(np.round(self.Qdelta_exp[m-1], 12)))
+
+    def node_solver(self, m):
+        """
+        The solver for node m with the current Qdelta coefficients, which is
+        built the first time that these coefficients are used.
+        """
+        key = self.solver_key(m)
+        if key not in self.solver_cache:
+            problem = NonlinearVariationalProblem(self.res(m).form, self.U_SDC,
+                                                  bcs=self.base.bcs)
+            prefix = f"{self.field_name}{type(self).__name__}{m}_{len(self.solver_cache)}"
+            self.solver_cache[key] = NonlinearVariationalSolver(
+                problem, solver_parameters=self.nonlinear_solver_parameters,
+                options_prefix=prefix)
+        return self.solver_cache[key]
+
+    def linear_node_solvers(self, m):
+        """
+        The solvers of the linearised problem at node m with the current
+        Qdelta coefficients: one for the node residual, projected into the
+        mixed space, and the hybridised solver for the correction.
+        """
+        key = self.solver_key(m)
+        if key not in self.linear_cache:
+            form = self.res(m).form
+            test = form.arguments()[0]
+            a = inner(TrialFunction(self.W), test)*dx
+            prefix = f"{self.field_name}{type(self).__name__}{m}_residual"
+            residual_solver = LinearVariationalSolver(
+                LinearVariationalProblem(a, -form, self.node_residual),
+                solver_parameters=self.linear_solver_parameters,
+                options_prefix=prefix)
+            # Qdelta includes dt, so this is the implicit weight of the node
+            # problem as a fraction of the time step
+            alpha = float(self.Qdelta_imp[m-1][m-1])/float(self.domain.dt)
+            linear_solver = CompressibleSolver(self.equation, alpha=alpha)
+            self.linear_cache[key] = (residual_solver, linear_solver)
+        return self.linear_cache[key]
+
+    @contextmanager
+    def timed(self, stage, node=None, solver=None):
+        """Record the time and solver iterations of a stage in the log."""
+        if self.solver_log is None:
+            yield
+            return
+        start = perf_counter()
+        yield
+        self.solver_log.record(self.steps_taken, self.sweeps, node, stage,
+                               perf_counter() - start, solver)
+
+    def node_range(self):
+        """The (1-based) nodes solved for by this process."""
+        return range(1, self.M+1)
+
+    def set_tolerances(self, solver):
+        """Loosen the tolerances of a node solver for the current sweep."""
+        snes = solver.snes
+        ksp = snes.getKSP()
+        if solver not in self.base_tolerances:
+            self.base_tolerances[solver] = (snes.getTolerances()[:2],
+                                            ksp.getTolerances()[:2])
+        (snes_rtol, snes_atol), (ksp_rtol, ksp_atol) = self.base_tolerances[solver]
+        snes.setTolerances(rtol=snes_rtol*self.loosening,
+                           atol=snes_atol*self.loosening)
+        ksp.setTolerances(rtol=ksp_rtol*self.loosening,
+                          atol=ksp_atol*self.loosening)
+
+    def check_refresh(self, solver, m):
+        """
+        Mark the Jacobian and preconditioner of the solver for node m to be
+        rebuilt if its Krylov iterations have grown too much since they were.
+        """
+        snes = solver.snes
+        newton_its = snes.getIterationNumber()
+        if newton_its == 0:
+            return
+        iterations = snes.getLinearSolveIterations()/newton_its
+        if solver not in self.baseline_iterations:
+            self.baseline_iterations[solver] = iterations
+        elif iterations > self.refresh_growth*max(self.baseline_iterations[solver], 1):
+            logger.info(f"Rebuilding the preconditioner of node {m}: "
+                        + f"{iterations:.1f} Krylov iterations per Newton "
+                        + f"iteration, from {self.baseline_iterations[solver]:.1f}")
+            # A lag of -2 rebuilds at the next Newton iteration, then never
+            # again, and the next solve sets the new baseline
+            snes.setLagJacobian(-2)
+            snes.setLagPreconditioner(-2)
+            del self.baseline_iterations[solver]
+            self.refreshes += 1
+
+    def last_sweep(self, k):
+        """Whether sweep k is known to be the last of the step."""
+        return k == self.maxk
+
+    def update_loosening(self, k):
+        """Set the loosening of the node solves of inexact sweep k."""
+        if self.last_sweep(k):
+            self.loosening = 1.
+            return
+        if not self.current_rhs:
+            self.residual = self.compute_residual()
+        rtol = self.nonlinear_solver_parameters.get("snes_rtol", 1e-8)
+        self.loosening = min(self.max_loosening,
+                             max(1., self.inexact*self.residual/rtol))
+
+    def predict(self):
+        """Set the initial guess for the node values at the start of a step."""
+        self.current_rhs = False
+        self.Unodes[0].assign(self.Un)
+        if self.initial_guess == "base":
+            for m in range(self.M):
+                self.base.dt = float(self.dtau[m])
+                self.base.apply(self.Unodes[m+1], self.Unodes[m])
+        elif self.initial_guess == "copy" or (
+                self.initial_guess == "extrapolate" and not self.has_history):
+            for m in range(self.M):
+                self.Unodes[m+1].assign(self.Un)
+        elif self.initial_guess == "extrapolate":
+            for m in range(self.M):
+                self.Unodes[m+1].assign(sum(
+                    float(w)*U for w, U in zip(self.weights_extrapolate[m],
+                                               self.Uprev) if w != 0))
+        else:
+            raise ValueError(f"Initial guess {self.initial_guess} not recognised")
+
+        for m in range(self.M+1):
+            self.Unodes1[m].assign(self.Unodes[m])
+
+    def evaluate_rhs(self, m, U):
+        """Evaluate F(U) (including source terms) into the store for node m."""
+        with self.timed("rhs", m, self.solver_rhs):
+            self.Uin.assign(U)
+            for evaluate in self.evaluate_source:
+                evaluate(self.Uin, self.base.dt, x_out=self.source_in)
+            self.solver_rhs.solve()
+            self.fUnodes[m-1].assign(self.Urhs)
+
+    def update_qdelta(self, k):
+        """MIN-SR-FLEX uses a different implicit Qdelta matrix for each sweep."""
+        if self.qdelta_imp_type == "MIN-SR-FLEX":
+            self.Qdelta_imp = genQDeltaCoeffs("MIN-SR-FLEX", form=self.formulation,
+                                              nodes=self.nodes, k=k)
+
+    def solve_node(self, m):
+        """Solve the implicit problem at node m of the current sweep."""
+        self.Q_.assign(self.quad[m-1])
+        if self.formulation == "N2N":
+            self.U_start.assign(self.Unodes1[m-1])
+        elif self.formulation == "Z2N":
+            self.U_start.assign(self.Unodes[0])
+        self.U_SDC.assign(self.Unodes[m])
+        if self.hybridised:
+            # One Newton step with the Jacobian about the reference profiles
+            residual_solver, linear_solver = self.linear_node_solvers(m)
+            with self.timed("solve", m, linear_solver.hybridized_solver):
+                residual_solver.solve()
+                linear_solver.solve(self.node_residual, self.dU)
+                self.U_SDC += self.dU
+        else:
+            solver = self.node_solver(m)
+            if self.inexact is not None:
+                self.set_tolerances(solver)
+            with self.timed("solve", m, solver):
+                solver.solve()
+            if self.refresh_growth is not None:
+                self.check_refresh(solver, m)
+        self.Unodes1[m].assign(self.U_SDC)
+
+    def evaluate_nodes(self, Unodes):
+        """
+        Evaluate F at the values `Unodes` of the nodes solved for here,
+        unless that is already done for the current node values.
+        """
+        if self.current_rhs:
+            return
+        for m in self.node_range():
+            self.evaluate_rhs(m, Unodes[m])
+
+    def compute_residual(self):
+        """
+        Return the largest relative collocation residual over the nodes,
+        U_0 + dt*sum(j=1,M) q_mj*F(U_j) - U_m at node m (or its node-to-node
+        equivalent for N2N), with the L2 norm of each field relative to that
+        field of U_m. This reuses the evaluations of F that the next sweep
+        needs, so costs no more than the norms.
+        """
+        self.evaluate_nodes(self.Unodes)
+        if not self.current_rhs:
+            self.compute_quad()
+            self.current_rhs = True
+
+        residual = 0.
+        for m in self.node_range():
+            start = self.Unodes[m-1] if self.formulation == "N2N" else self.Unodes[0]
+            self.U_diff.assign(start + self.quad[m-1] - self.Unodes[m])
+            residual = max(residual, relative_norm(self.U_diff, self.Unodes[m]))
+        return residual
+
+    def sweep(self, k):
+        """Make correction sweep k (counting from 1)."""
+        self.update_qdelta(k)
+        if self.inexact is not None:
+            self.update_loosening(k)
+
+        # Compute sum(j=1,M) q_mj*F(y_j^k) (or s_mj for N2N) for each node
+        self.evaluate_nodes(self.Unodes)
+        self.compute_quad()
+
+        # Loop through quadrature nodes and solve
+        self.Unodes1[0].assign(self.Unodes[0])
+        for m in self.node_range():
+            self.solve_node(m)
+        if self.estimate_error:
+            self.U_diff.assign(self.Unodes1[-1] - self.Unodes[-1])
+            self.error = relative_norm(self.U_diff, self.Unodes1[-1])
+        for m in self.node_range():
+            self.Unodes[m].assign(self.Unodes1[m])
+        self.current_rhs = False
+
+    def continue_sweeps(self):
+        """Whether to make another sweep, given the `self.sweeps` made so far."""
+        return self.sweeps < self.maxk
+
+    def final_value(self, x_out):
+        """Set the value at the end of the step from the converged nodes."""
+        if self.final_update:
+            # Compute y^(n+1) = y^n + sum(j=1,M) q_j*F(y_j)
+            self.evaluate_nodes(self.Unodes1)
+            with self.timed("final", solver=self.solver_fin):
+                self.compute_quad_final()
+                self.U_fin.assign(self.Unodes[-1])
+                self.solver_fin.solve()
+            result = self.U_fin
+        else:
+            result = self.last_node_value()
+
+        # Apply limiter if required
+        if self.limiter is not None:
+            self.limiter.apply(result)
+        x_out.assign(result)
+
+    def last_node_value(self):
+        """The value at the final node, tau_M."""
+        return self.Unodes[-1]
+
+    def apply(self, x_out, x_in):
+        """
+        Apply the SDC time discretisation.
+
+        Args:
+            x_out (:class:`Function`): the output field to be computed.
+            x_in (:class:`Function`): the input field.
+        """
+        self.steps_taken += 1
+        with self.timed("step"):
+            self.Un.assign(x_in)
+            self.sweeps = 0
+            with self.timed("predict"):
+                self.predict()
+
+            while self.continue_sweeps():
+                self.sweeps += 1
+                self.sweep(self.sweeps)
+
+            if self.sweeps > 0:
+                self.final_value(x_out)
+            else:
+                x_out.assign(self.last_node_value())
+
+            if self.initial_guess == "extrapolate":
+                self.Uprev[0].assign(self.Un)
+                for m in range(1, self.M+1):
+                    self.Uprev[m].assign(self.Unodes[m])
+                self.has_history = True
+
+        if self.solver_log is not None:
+            self.solver_log.flush()
+
+
+class AdaptiveSDC(SweepSDC):
+    """
+    SDC that stops sweeping once the collocation problem is solved to within
+    a tolerance, with the number of iterations `maxk` as a maximum.
+
+    Before each sweep after the first, the relative collocation residual (see
+    `compute_residual`) is checked, and sweeping stops once it is below
+    `tolerance`. The sweeps made in each step are logged, and kept in
+    `sweep_counts`. With inexact sweeps, a step whose residual is first
+    below `tolerance` after a loosened sweep makes one more sweep, solved to
+    the usual tolerances, so that its values never come from a loosened one.
+
+    Args:
+        tolerance (float): the relative residual at which to stop sweeping.
+        The remaining arguments are those of gusto's `SDC`.
+    """
+
+    def __init__(self, base_scheme, domain, M, maxk, quad_type, node_type,
+                 qdelta_imp, qdelta_exp, tolerance, **kwargs):
+        super().__init__(base_scheme, domain, M, maxk, quad_type, node_type,
+                         qdelta_imp, qdelta_exp, **kwargs)
+        self.tolerance = tolerance
+        self.sweep_counts = []
+        # Whether the next sweep is the extra one at the usual tolerances
+        self.tight_sweep = False
+
+    def continue_sweeps(self):
+        if self.sweeps == 0:
+            self.tight_sweep = False
+            return True
+        if self.sweeps == self.maxk:
+            # The last residual checked is from before this sweep
+            self.residual = None
+            return False
+        self.residual = self.compute_residual()
+        if self.residual > self.tolerance:
+            return True
+        self.tight_sweep = self.loosening > 1.
+        return self.tight_sweep
+
+    def last_sweep(self, k):
+        return super().last_sweep(k) or self.tight_sweep
+
+    def apply(self, x_out, x_in):
+        self.residual = None
+        super().apply(x_out, x_in)
+        self.sweep_counts.append(self.sweeps)
+        if self.residual is None:
+            logger.info(f"SDC sweeps: {self.sweeps}")
+        else:
+            logger.info(f"SDC sweeps: {self.sweeps}, residual: {self.residual:.3e}")
+
+
+class ParallelSDC(SweepSDC):
+    """
+    SDC that is parallel across the collocation nodes.
+
+    With diagonal implicit and explicit Qdelta matrices (e.g. MIN-SR-FLEX and
+    MIN-SR-NS), the node solves within a sweep are independent. Each member
+    of the ensemble owns one node: it evaluates F and solves only at that
+    node, on the ensemble's spatial sub-communicator, and the quadrature sums
+    that couple the nodes are formed by ensemble reductions.
+
+    Args:
+        ensemble (:class:`Ensemble`): the ensemble, which must have one member
+            per collocation node. The mesh must be built on `ensemble.comm`.
+        The remaining arguments are those of gusto's `SDC`.
+    """
+
+    def __init__(self, ensemble, base_scheme, domain, M, maxk, quad_type,
+                 node_type, qdelta_imp, qdelta_exp, **kwargs):
+        super().__init__(base_scheme, domain, M, maxk, quad_type, node_type,
+                         qdelta_imp, qdelta_exp, **kwargs)
+
+        if ensemble.ensemble_comm.size != M:
+            raise ValueError(f'Parallel SDC needs one ensemble member per node, '
+                             f'but has {ensemble.ensemble_comm.size} members '
+                             f'for {M} nodes')
+        for Qdelta, name in [(self.Qdelta_imp, qdelta_imp),
+                             (self.Qdelta_exp, qdelta_exp)]:
+            Qdelta = np.asarray(Qdelta)
+            if not np.allclose(Qdelta, np.diag(np.diag(Qdelta))):
+                raise ValueError(f'Qdelta matrix {name} is not diagonal, so the '
+                                 + 'node solves cannot be made in parallel')
+
+        self.ensemble = ensemble
+        self.node = ensemble.ensemble_comm.rank + 1
+
+    def setup(self, equation, apply_bcs=True, *active_labels):
+        super().setup(equation, apply_bcs, *active_labels)
+        self.quad_part = Function(self.W)
+
+    def node_range(self):
+        return [self.node]
+
+    def compute_quad(self):
+        # Only F at this member's node is known here, so each member adds its
+        # column of Q into the sum for every node, reduced onto that node's
+        # member
+        f = self.fUnodes[self.node-1]
+        for j in range(self.M):
+            self.quad_part.assign(float(self.Q[j, self.node-1])*f)
+            self.ensemble.reduce(self.quad_part, self.quad[j], root=j)
+
+    def compute_quad_final(self):
+        f = self.fUnodes[self.node-1]
+        self.quad_part.assign(float(self.Qfin[self.node-1])*f)
+        self.ensemble.allreduce(self.quad_part, self.quad_final)
+
+    def last_node_value(self):
+        # The final node is owned by the last member
+        self.ensemble.bcast(self.Unodes[-1], root=self.M-1)
+        return self.Unodes[-1]
@@ -0,0 +1,95 @@
+"""
+A per-run log of where the time of the SDC steps goes.
+
+Each row of the log is one stage of a step: the predictor, the evaluation of
+F and the implicit solve at each node of each sweep, the final update and
+the step as a whole, with its wall time and, for the stages that solve, the
+SNES and KSP iteration counts. The log is a CSV file, written next to the
+run's field_output.nc by rank 0 of the run's communicator.
+"""
+import os
+
+from firedrake import COMM_WORLD
+
+log_filename = 'solver_log.csv'
+columns = ['step', 'sweep', 'node', 'stage', 'time', 'snes_its', 'ksp_its']
+
+
+class SolverLog(object):
+    """
+    Log of the timings and solver iterations of each step of a run.
+
+    The file is only opened when the first row is recorded, and it is
+    appended to if it exists, as when a run is resumed. The output directory
+    is created if gusto has not yet made it, as when the output is written by
+    other processes.
+
+    Args:
+        dirname (str): the output directory of the run, relative to results/.
+        comm (:class:`MPI.Comm`, optional): the communicator of the run.
+            Defaults to COMM_WORLD.
+        filename (str, optional): the name of the file. Defaults to
+            `log_filename`.
+        deferred (bool, optional): whether to keep the rows until the log is
+            closed, for processes that must not make the output directory
+            before the ones writing the run's output. Defaults to False.
+    """
+
+    def __init__(self, dirname, comm=COMM_WORLD, filename=log_filename,
+                 deferred=False):
+        self.filename = os.path.join('results', dirname, filename)
+        self.comm = comm
+        self.file = None
+        self.deferred_rows = [] if deferred else None
+
+    def record(self, step, sweep, node, stage, time, solver=None):
+        """
+        Record a stage of a step.
+
+        Args:
+            step (int): the number of the step, counting from 1.
+            sweep (int): the sweep, which is 0 for the predictor and, for
+                the final update and whole step, the number of sweeps made.
+            node (int): the node, or None for stages not at a single node.
+            stage (str): the name of the stage.
+            time (float): the wall time taken, in seconds.
+            solver (:class:`NonlinearVariationalSolver`, optional): the solver
+                used by the stage, whose iteration counts are recorded.
+        """
+        if self.comm.rank != 0:
+            return
+        if solver is None:
+            snes_its, ksp_its = '', ''
+        else:
+            snes_its = solver.snes.getIterationNumber()
+            ksp_its = solver.snes.getLinearSolveIterations()
+        node = '' if node is None else node
+        self.write([step, sweep, node, stage, f'{time:.6f}', snes_its, ksp_its])
+
+    def write(self, row):
+        if self.deferred_rows is not None:
+            self.deferred_rows.append(row)
+            return
+        self.write_row(row)
+
+    def write_row(self, row):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            new_file = not os.path.exists(self.filename)
+            self.file = open(self.filename, 'a')
+            if new_file:
+                self.file.write(','.join(columns) + '\n')
+        self.file.write(','.join(str(value) for value in row) + '\n')
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.deferred_rows:
+            for row in self.deferred_rows:
+                self.write_row(row)
+            self.deferred_rows.clear()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,145 @@
+"""
+The Williamson 1 test case (advection of gaussian hill), solved with a
+discretisation of the non-linear advection equations on a cubed sphere mesh.
+
+The reference solution uses SSPRK3 at a small time step; the convergence runs
+use explicit SDC with forward Euler as the base scheme.
+"""
+from firedrake import (
+    SpatialCoordinate, pi, cos, sin, acos, grad, conditional, FunctionSpace,
+    Function, COMM_WORLD
+)
+from gusto import (
+    Domain, AdvectionEquation, OutputParameters, IO, SSPRK3, ForwardEuler, SDC,
+    DGUpwind, PrescribedTransport, time_derivative, explicit, lonlatr_from_xyz
+)
+
+from .common import cubed_sphere_mesh
+from .registry import register_case
+
+day = 24.*60.*60.
+R = 6371220.
+
+williamson1_defaults = {
+    'ref_level': 5,
+    'degree': 1,
+    'dt': 0.5,
+    'tmax': 1*day,
+    'ndumps': 1,
+    'scheme': 'ssprk3',
+    'dirname': None,
+    'comm': COMM_WORLD
+}
+
+# (M, k) of the explicit SDC schemes, indexed as in the Figure 1 output names
+williamson1_sdc_schemes = {
+    0: (4, 7),
+    1: (2, 3),
+    2: (3, 5)
+}
+
+
+def williamson1_dirname(ref_level, degree, dt, scheme):
+    """Output directory of a run, as read by the Figure 1 script."""
+    if scheme == 'ssprk3':
+        return "williamson_1_true_paper7_ref%s_dt%s_deg%s" % (ref_level, dt, degree)
+    return "williamson_1_EX_SDC_paper7_ref%s_dt%s_k%s_deg%s" % (ref_level, dt, scheme, degree)
+
+
+def williamson1_cost(ref_level, dt, tmax, scheme, **kwargs):
+    """Relative cost of a run: cells x steps x stages or node solves."""
+    if scheme == 'ssprk3':
+        stages = 3
+    else:
+        M, k = williamson1_sdc_schemes[scheme]
+        stages = M*k
+    return 6*4**ref_level*(tmax/dt)*stages
+
+
+@register_case('williamson1', williamson1_defaults, cost=williamson1_cost)
+def setup_williamson1(ref_level, degree, dt, tmax, ndumps, scheme, dirname,
+                      comm):
+
+    if dirname is None:
+        dirname = williamson1_dirname(ref_level, degree, dt, scheme)
+
+    # ------------------------------------------------------------------------ #
+    # Set up model objects
+    # ------------------------------------------------------------------------ #
+
+    mesh = cubed_sphere_mesh(R, ref_level, degree=2, comm=comm)
+    x = SpatialCoordinate(mesh)
+
+    # Domain
+    domain = Domain(mesh, dt, 'RTCF', degree)
+
+    # Equation
+    V = domain.spaces('DG')
+    eqns = AdvectionEquation(domain, V, "D")
+
+    # I/O
+    dumpfreq = int(tmax / (ndumps*dt))
+    output = OutputParameters(dirname=dirname,
+                              dumpfreq=dumpfreq,
+                              checkpoint=True,
+                              dump_nc=True,
+                              dump_vtus=False,
+                              checkpoint_method="checkpointfile",
+                              chkptfreq=dumpfreq,
+                              dumplist_latlon=['D'])
+    io = IO(domain, output)
+
+    solver_parameters = {'snes_type': 'ksponly',
+                         'ksp_type': 'cg',
+                         'pc_type': 'bjacobi',
+                         'sub_pc_type': 'ilu'}
+
+    # Time discretisation
+    if scheme == 'ssprk3':
+        time_scheme = SSPRK3(domain, solver_parameters=solver_parameters)
+    else:
+        eqns.label_terms(lambda t: not t.has_label(time_derivative), explicit)
+        M, k = williamson1_sdc_schemes[scheme]
+        quad_type = "GAUSS"
+        node_type = "LEGENDRE"
+        qdelta_imp = "BE"
+        qdelta_exp = "FE"
+        base_scheme = ForwardEuler(domain, solver_parameters=solver_parameters)
+        time_scheme = SDC(base_scheme, domain, M, k, quad_type, node_type,
+                          qdelta_imp, qdelta_exp,
+                          nonlinear_solver_parameters=solver_parameters,
+                          formulation="Z2N", final_update=True,
+                          initial_guess="copy")
+
+    transport_methods = [DGUpwind(eqns, "D")]
+    stepper = PrescribedTransport(eqns, time_scheme, io,
+                                  prescribed_transporting_velocity=False,
+                                  transport_method=transport_methods)
+
+    # ------------------------------------------------------------------------ #
+    # Initial conditions
+    # ------------------------------------------------------------------------ #
+    u0 = stepper.fields('u')
+    D0 = stepper.fields('D')
+
+    u_max = 2*pi*R/(12*day)  # Maximum amplitude of the zonal wind (m/s)
+    D_max = 1000.
+    lamda, theta, _ = lonlatr_from_xyz(x[0], x[1], x[2])
+    lamda_c = 3.*pi/2.
+    theta_c = 0.
+    alpha = 0.
+
+    # Intilising the velocity field
+    CG2 = FunctionSpace(mesh, 'CG', degree+1)
+    psi = Function(CG2)
+    psiexpr = -R*u_max*(sin(theta)*cos(alpha)-cos(alpha)*cos(theta)*sin(alpha))
+    psi.interpolate(psiexpr)
+    uexpr = domain.perp(grad(psi))
+    c_dist = R*acos(sin(theta_c)*sin(theta) + cos(theta_c)*cos(theta)*cos(lamda-lamda_c))
+
+    Dexpr = conditional(c_dist < R/3., 0.5*D_max*(1.+cos(3.*pi*c_dist/R)), 0.0)
+
+    u0.project(uexpr)
+    D0.interpolate(Dexpr)
+
+    return stepper